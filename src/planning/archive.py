@@ -0,0 +1,313 @@
+"""Archive module.
+
+Stores finished plannings in a compact columnar format: one memory-mapped
+int8 matrix (days x employees) per planning, plus a catalog with the indexes
+by case, employee, date range and shift. Queries only read the rows and
+columns of the plannings selected by the indexes.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .employee import read_planning
+except ImportError:
+    from employee import read_planning
+
+CATALOG_FILE = "catalog.json"
+EMPTY_LABEL = ""
+
+
+class PlanArchive:
+    """Archive of finished plannings.
+
+    :param path: Directory of the archive, created when it does not exist
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "plans"), exist_ok=True)
+
+        catalog_file = os.path.join(path, CATALOG_FILE)
+        if os.path.exists(catalog_file):
+            with open(catalog_file) as file:
+                catalog = json.load(file)
+        else:
+            catalog = {"labels": [EMPTY_LABEL], "next_id": 0, "plans": []}
+
+        self.labels = catalog["labels"]
+        self.codes = {label: code for code, label in enumerate(self.labels)}
+        self.next_id = catalog["next_id"]
+        self.plans = catalog["plans"]
+        self._build_indexes()
+
+    def __len__(self):
+        return len(self.plans)
+
+    def _build_indexes(self):
+        self.by_key = {}
+        self.by_case = {}
+        self.by_employee = {}
+        for position, plan in enumerate(self.plans):
+            self._index_plan(position, plan)
+        self._build_date_indexes()
+
+    def _index_plan(self, position, plan):
+        self.by_key[(plan["case"], plan["name"])] = position
+        self.by_case.setdefault(plan["case"], []).append(position)
+        for column, employee in enumerate(plan["employees"]):
+            self.by_employee.setdefault(employee, []).append((position, column))
+
+    def _build_date_indexes(self):
+        self.starts = np.array([plan["start"] for plan in self.plans], dtype="datetime64[D]")
+        self.ends = self.starts + np.array([plan["days"] for plan in self.plans], dtype="timedelta64[D]")
+
+    def _save_catalog(self):
+        catalog = {"labels": self.labels, "next_id": self.next_id, "plans": self.plans}
+        catalog_file = os.path.join(self.path, CATALOG_FILE)
+        with open(catalog_file + ".tmp", "w") as file:
+            json.dump(catalog, file, separators=(",", ":"))
+        os.replace(catalog_file + ".tmp", catalog_file)
+
+    def _code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            if len(self.labels) == np.iinfo(np.int8).max:
+                raise ValueError(f"Too many different values in the archive, unknown value {label!r}")
+            code = len(self.labels)
+            self.labels.append(label)
+            self.codes[label] = code
+        return code
+
+    def _grid_file(self, plan):
+        return os.path.join(self.path, "plans", f"{plan['id']}.npy")
+
+    def add(self, employees_info, case, name):
+        """Add a planning, replacing the planning with the same case and name.
+
+        :param employees_info: DataFrame with a row per date and a column per employee
+        :param case: Case of the planning
+        :param name: Name of the planning inside the case
+        :return: Id of the planning in the archive
+        """
+        plan_id = self._add(employees_info, case, name)
+        self._build_date_indexes()
+        self._save_catalog()
+        return plan_id
+
+    def add_many(self, plannings):
+        """Add several plannings, writing the catalog once.
+
+        :param plannings: Iterable of (employees_info, case, name) tuples
+        :return: List with the ids of the plannings in the archive
+        """
+        plan_ids = [self._add(employees_info, case, name) for employees_info, case, name in plannings]
+        self._build_date_indexes()
+        self._save_catalog()
+        return plan_ids
+
+    def _add(self, employees_info, case, name):
+        planning = employees_info.copy()
+        planning.index = pd.to_datetime(planning.index)
+        dates = pd.date_range(start=planning.index.min(), end=planning.index.max(), freq="D")
+        planning = planning.reindex(dates).fillna(EMPTY_LABEL)
+
+        values = planning.to_numpy(dtype=object)
+        positions, uniques = pd.factorize(values.ravel())
+        lookup = np.array([self._code(str(label)) for label in uniques], dtype=np.int8)
+        grid = lookup[positions].reshape(values.shape)
+
+        shift_counts = {}
+        for code in np.unique(grid):
+            if self.labels[code] != EMPTY_LABEL:
+                shift_counts[self.labels[code]] = (grid == code).sum(axis=0).tolist()
+
+        key = (case, name)
+        replaced = key in self.by_key
+        if replaced:
+            plan_id = self.plans.pop(self.by_key[key])["id"]
+        else:
+            plan_id = self.next_id
+            self.next_id += 1
+
+        plan = {
+            "id": plan_id,
+            "case": case,
+            "name": name,
+            "start": str(dates[0].date()),
+            "days": len(dates),
+            "employees": [str(employee) for employee in planning.columns],
+            "shift_counts": shift_counts,
+        }
+        np.save(self._grid_file(plan), grid)
+        self.plans.append(plan)
+        if replaced:
+            self._build_indexes()
+        else:
+            self._index_plan(len(self.plans) - 1, plan)
+
+        return plan_id
+
+    def add_file(self, planning_file, case, name=None, year=None):
+        """Add a planning file supported by read_planning.
+
+        :param planning_file: Path to the planning file
+        :param case: Case of the planning
+        :param name: Name of the planning, the file name without extension by default
+        :param year: Year of the planning, needed for files written by generate_transposed_excel_with_styles
+        :return: Id of the planning in the archive
+        """
+        if name is None:
+            name = os.path.splitext(os.path.basename(planning_file))[0]
+        return self.add(read_planning(planning_file, year), case, name)
+
+    def remove(self, case, name):
+        """Remove a planning.
+
+        :param case: Case of the planning
+        :param name: Name of the planning inside the case
+        """
+        plan = self.plans.pop(self.by_key[(case, name)])
+        os.remove(self._grid_file(plan))
+        self._save_catalog()
+        self._build_indexes()
+
+    def catalog(self):
+        """List the archived plannings.
+
+        :return: DataFrame with id, case, name, start, end and number of employees of each planning
+        """
+        return pd.DataFrame(
+            {
+                "id": [plan["id"] for plan in self.plans],
+                "case": [plan["case"] for plan in self.plans],
+                "name": [plan["name"] for plan in self.plans],
+                "start": pd.to_datetime(self.starts),
+                "end": pd.to_datetime(self.ends - np.timedelta64(1, "D")),
+                "employees": [len(plan["employees"]) for plan in self.plans],
+            }
+        )
+
+    def load(self, case, name):
+        """Load a whole planning.
+
+        :param case: Case of the planning
+        :param name: Name of the planning inside the case
+        :return: DataFrame with a row per date and a column per employee
+        """
+        plan = self.plans[self.by_key[(case, name)]]
+        grid = np.load(self._grid_file(plan))
+        dates = pd.date_range(start=plan["start"], periods=plan["days"], freq="D")
+        return pd.DataFrame(np.asarray(self.labels, dtype=object)[grid], index=dates, columns=plan["employees"])
+
+    def _select(self, employee, start, end, shift, case):
+        if employee is not None:
+            selection = self.by_employee.get(employee, [])
+        else:
+            selection = [(position, None) for position in range(len(self.plans))]
+
+        if case is not None:
+            cases = {case} if isinstance(case, str) else set(case)
+            selection = [(position, column) for position, column in selection if self.plans[position]["case"] in cases]
+
+        overlaps = np.ones(len(self.plans), dtype=bool)
+        if start is not None:
+            overlaps &= self.ends > np.datetime64(pd.Timestamp(start).date(), "D")
+        if end is not None:
+            overlaps &= self.starts <= np.datetime64(pd.Timestamp(end).date(), "D")
+        selection = [(position, column) for position, column in selection if overlaps[position]]
+
+        if shift is not None:
+            selection = [
+                (position, column)
+                for position, column in selection
+                if self._shift_count(position, column, shift)
+            ]
+
+        return selection
+
+    def _shift_count(self, position, column, shift):
+        counts = self.plans[position]["shift_counts"].get(shift)
+        if counts is None:
+            return 0
+        return sum(counts) if column is None else counts[column]
+
+    def query(self, employee=None, start=None, end=None, shift=None, case=None, weekdays=None):
+        """Find the assignments matching all the given filters.
+
+        :param employee: Employee name
+        :param start: First date, inclusive
+        :param end: Last date, inclusive
+        :param shift: Cell value, a shift like "M" or a rest value like "V"
+        :param case: Case name or list of case names
+        :param weekdays: Weekdays to keep (0 is Monday), e.g. the weekend days of the rules
+        :return: DataFrame with case, name, date, employee and shift columns
+        """
+        shift_code = self.codes.get(shift) if shift is not None else None
+        if shift is not None and shift_code is None:
+            return self._frame([], [], [], [], [])
+
+        start_day = None if start is None else np.datetime64(pd.Timestamp(start).date(), "D")
+        end_day = None if end is None else np.datetime64(pd.Timestamp(end).date(), "D")
+
+        cases, names, dates, employees, shifts = [], [], [], [], []
+        for position, column in self._select(employee, start, end, shift, case):
+            plan = self.plans[position]
+            plan_start = self.starts[position]
+            first = 0 if start_day is None else max(0, int((start_day - plan_start).astype(int)))
+            last = plan["days"] if end_day is None else min(plan["days"], int((end_day - plan_start).astype(int)) + 1)
+            if first >= last:
+                continue
+
+            grid = np.load(self._grid_file(plan), mmap_mode="r")
+            block = np.asarray(grid[first:last] if column is None else grid[first:last, column : column + 1])
+            mask = block != self.codes[EMPTY_LABEL] if shift_code is None else block == shift_code
+            if weekdays is not None:
+                day_dates = plan_start + np.arange(first, last).astype("timedelta64[D]")
+                # 1970-01-01 was a Thursday
+                day_weekdays = (day_dates.view("int64") + 3) % 7
+                mask &= np.isin(day_weekdays, list(weekdays))[:, None]
+
+            days, columns = np.nonzero(mask)
+            plan_employees = plan["employees"] if column is None else [plan["employees"][column]]
+            cases.extend([plan["case"]] * len(days))
+            names.extend([plan["name"]] * len(days))
+            dates.append(plan_start + (first + days).astype("timedelta64[D]"))
+            employees.extend(np.asarray(plan_employees, dtype=object)[columns])
+            shifts.append(block[days, columns])
+
+        return self._frame(cases, names, dates, employees, shifts)
+
+    def _frame(self, cases, names, dates, employees, shifts):
+        dates = np.concatenate(dates) if dates else np.array([], dtype="datetime64[D]")
+        shifts = np.concatenate(shifts) if shifts else np.array([], dtype=np.int8)
+        return pd.DataFrame(
+            {
+                "case": cases,
+                "name": names,
+                "date": pd.to_datetime(dates),
+                "employee": employees,
+                "shift": np.asarray(self.labels, dtype=object)[shifts.astype(np.intp)],
+            }
+        )
+
+    def count(self, employee=None, start=None, end=None, shift=None, case=None, weekdays=None):
+        """Count the assignments matching all the given filters.
+
+        :param employee: Employee name
+        :param start: First date, inclusive
+        :param end: Last date, inclusive
+        :param shift: Cell value, a shift like "M" or a rest value like "V"
+        :param case: Case name or list of case names
+        :param weekdays: Weekdays to keep (0 is Monday)
+        :return: Number of matching assignments
+        """
+        if start is None and end is None and weekdays is None and shift is not None:
+            return sum(
+                self._shift_count(position, column, shift)
+                for position, column in self._select(employee, None, None, shift, case)
+            )
+        return len(self.query(employee, start, end, shift, case, weekdays))
@@ -0,0 +1,166 @@
+"""Decision trace module.
+
+Records why each candidate was (or was not) scheduled by the solver. Events are
+stored in a preallocated structured array with integer-coded day, employee,
+shift and reason, so recording an event never allocates a Python object.
+"""
+
+import numpy as np
+import pandas as pd
+
+ASSIGNED = 0
+OCCUPIED = 1
+REST_SUCCESSION = 2
+YEAR_HOURS = 3
+WEEK_HOURS = 4
+WEEKEND_REST = 5
+SHIFT_FULL = 6
+COVERAGE_REPAIR = 7
+COVERAGE_HANDOVER = 8
+
+REASONS = (
+    "assigned",
+    "occupied",
+    "rest_succession",
+    "year_hours",
+    "week_hours",
+    "weekend_rest",
+    "shift_full",
+    "coverage_repair",
+    "coverage_handover",
+)
+
+TRACE_DTYPE = np.dtype(
+    [
+        ("day", np.int32),
+        ("employee", np.int16),
+        ("shift", np.int8),
+        ("reason", np.int8),
+    ]
+)
+
+
+class DecisionTrace:
+    """Compact buffer of solver decisions.
+
+    :param start_date: First date of the planning, day 0 of the trace
+    :param employees: Employee names in solver column order
+    :param shifts: Shift names in solver order
+    :param capacity: Number of records preallocated, the buffer doubles when full
+    """
+
+    def __init__(self, start_date, employees, shifts, capacity=65536):
+        self.start_date = pd.Timestamp(start_date)
+        self.employees = list(employees)
+        self.shifts = list(shifts)
+        self.employee_index = {employee: index for index, employee in enumerate(self.employees)}
+        self.records = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def record(self, day, employee, shift, reason):
+        """Record one candidate evaluation.
+
+        :param day: Day offset from start_date
+        :param employee: Employee index
+        :param shift: Shift index
+        :param reason: Reason code
+        """
+        if self.size == len(self.records):
+            self.records = np.concatenate([self.records, np.zeros(max(len(self.records), 1), dtype=TRACE_DTYPE)])
+        self.records[self.size] = (day, employee, shift, reason)
+        self.size += 1
+
+    def clear(self):
+        """Drop all recorded events, keeping the allocated buffer."""
+        self.size = 0
+
+    def view(self):
+        """Return the filled part of the buffer.
+
+        :return: Structured numpy array with the recorded events
+        """
+        return self.records[: self.size]
+
+    def _to_frame(self, records):
+        return pd.DataFrame(
+            {
+                "date": self.start_date + pd.to_timedelta(records["day"], unit="D"),
+                "employee": np.asarray(self.employees, dtype=object)[records["employee"]],
+                "shift": np.asarray(self.shifts, dtype=object)[records["shift"]],
+                "reason": np.asarray(REASONS, dtype=object)[records["reason"]],
+            }
+        )
+
+    def to_frame(self):
+        """Decode the whole trace.
+
+        :return: DataFrame with date, employee, shift and reason columns
+        """
+        return self._to_frame(self.view())
+
+    def for_employee(self, employee):
+        """Decisions taken for an employee.
+
+        :param employee: Employee name
+        :return: DataFrame with the employee events
+        """
+        records = self.view()
+        return self._to_frame(records[records["employee"] == self.employee_index[employee]])
+
+    def for_date(self, date):
+        """Decisions taken on a date.
+
+        :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+        :return: DataFrame with the date events
+        """
+        day = (pd.Timestamp(date) - self.start_date).days
+        records = self.view()
+        return self._to_frame(records[records["day"] == day])
+
+    def explain(self, employee, date):
+        """Reasons recorded for an employee on a date.
+
+        :param employee: Employee name
+        :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+        :return: DataFrame with the events, in the order they were recorded
+        """
+        day = (pd.Timestamp(date) - self.start_date).days
+        records = self.view()
+        mask = (records["day"] == day) & (records["employee"] == self.employee_index[employee])
+        return self._to_frame(records[mask])
+
+    def to_csv(self, filename):
+        """Export the decoded trace to a CSV file.
+
+        :param filename: Output file
+        """
+        self.to_frame().to_csv(filename, index=False)
+
+    def save(self, filename):
+        """Export the raw trace to a numpy .npz file.
+
+        :param filename: Output file
+        """
+        np.savez_compressed(
+            filename,
+            records=self.view(),
+            start_date=str(self.start_date.date()),
+            employees=np.asarray(self.employees),
+            shifts=np.asarray(self.shifts),
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Load a trace saved with save.
+
+        :param filename: Input file
+        :return: DecisionTrace
+        """
+        with np.load(filename) as data:
+            trace = cls(str(data["start_date"]), data["employees"].tolist(), data["shifts"].tolist(), capacity=1)
+            trace.records = data["records"].copy()
+        trace.size = len(trace.records)
+        return trace
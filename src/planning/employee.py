@@ -2,24 +2,42 @@
 
 import json
 import os
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 
 import numpy as np
 import pandas as pd
 import yaml
 from openpyxl import (
+    Workbook,
     load_workbook,
 )
+from openpyxl.formatting.rule import FormulaRule
 from openpyxl.styles import (
     Alignment,
     Border,
     Font,
+    NamedStyle,
     PatternFill,
     Side,
 )
+from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.worksheet.dimensions import ColumnDimension
 from pandas.core.indexes.frozen import FrozenList
 
+try:
+    from .decision_trace import DecisionTrace
+    from .rules import DEFAULT_HIGHLIGHT_DAYS, DEFAULT_WEEKEND_DAYS, REST_LABEL, VACATION_LABEL, compile_rules
+    from .solver import BeamSolver, ShiftSolver
+except ImportError:
+    from decision_trace import DecisionTrace
+    from rules import DEFAULT_HIGHLIGHT_DAYS, DEFAULT_WEEKEND_DAYS, REST_LABEL, VACATION_LABEL, compile_rules
+    from solver import BeamSolver, ShiftSolver
+
+CELL_STYLE = "planning_cell"
+HEADER_STYLE = "planning_header"
+
 
 def create_employees(employee_restrictions):
     """Create employees.
@@ -68,34 +86,38 @@ def create_employees_with_dates(start_date, num_days, employees):
     return employees_info, dates
 
 
-def init_employees_by_shifts(dates, employee_restrictions):
+def init_employees_by_shifts(dates, employee_restrictions, rules=None):
     """Init employees by shifts.
 
     :param dates: List of dates
     :param employee_restrictions: Dictionary with employee restrictions
+    :param rules: Optional CompiledRules, its shifts take precedence over employee_restrictions
     :return:
     """
+    shifts = rules.shifts if rules is not None else employee_restrictions["shifts"]
     all_employees_by_shift = pd.DataFrame(
         index=dates,
-        columns=[one_shift for one_shift in employee_restrictions["shifts"]],
+        columns=[one_shift for one_shift in shifts],
     )
     all_employees_by_shift[:] = 0
 
     return all_employees_by_shift
 
 
-def get_weekends_of_month(year, month):
+def get_weekends_of_month(year, month, rules=None):
     """Get weekends of month.
 
     :param year: Year as an integer
     :param month: Month as an integer
+    :param rules: CompiledRules with the weekend days, defaults to Friday to Sunday
     :return: DataFrame with weekends of the month
     """
     start_date = pd.Timestamp(year=year, month=month, day=1)
     end_date = start_date + pd.offsets.MonthEnd(1)
     date_range = pd.date_range(start=start_date, end=end_date, freq="D")
 
-    weekends = date_range[date_range.weekday.isin([4, 5, 6])]
+    weekend_days = rules.weekend_days if rules is not None else DEFAULT_WEEKEND_DAYS
+    weekends = date_range[date_range.weekday.isin(weekend_days)]
 
     weekends_df = pd.DataFrame(weekends, columns=["Date"])
 
@@ -104,34 +126,38 @@ def get_weekends_of_month(year, month):
     return weekends_df, num_weekends
 
 
-def count_weekend_workdays(employees_info, employee, year, month):
+def count_weekend_workdays(employees_info, employee, year, month, rules=None):
     """Count the number of weekend workdays for the given employee in the specified month.
 
     :param employees_info: DataFrame with employee information
     :param employee: Employee name or ID
     :param year: Year as an integer
     :param month: Month as an integer
+    :param rules: CompiledRules with the weekend days and shifts, defaults to Friday to Sunday and M and T shifts
     :return: Number of weekend workdays
     """
-    weekends_df = get_weekends_of_month(year, month)
+    weekends_df, _ = get_weekends_of_month(year, month, rules)
 
-    weekends_df, _ = weekends_df
     weekend_workdays = employees_info.loc[weekends_df["Date"], employee]
-    total_weekend_workdays = weekend_workdays.value_counts().reindex(["M", "T"], fill_value=0).sum()
+    if rules is None:
+        total_weekend_workdays = weekend_workdays.value_counts().reindex(["M", "T"], fill_value=0).sum()
+    else:
+        total_weekend_workdays = rules.worked[rules.encode(weekend_workdays)].sum()
 
     return total_weekend_workdays
 
 
-def count_remaining_weekends(date):
+def count_remaining_weekends(date, rules=None):
     """Count the number of remaining weekends in the current month from the given date.
 
     :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+    :param rules: CompiledRules with the weekend days, defaults to Friday to Sunday
     :return: Number of remaining weekends in the current month
     """
     if isinstance(date, str):
         date = pd.Timestamp(date)
 
-    weekends_df, _ = get_weekends_of_month(date.year, date.month)
+    weekends_df, _ = get_weekends_of_month(date.year, date.month, rules)
 
     remaining_weekends = weekends_df[weekends_df["Date"] > date]
 
@@ -176,24 +202,25 @@ def count_week_restdays(employees_info, employee, date, start_date):
     """
     week_dates = get_current_week_dates(date, start_date)
     week_restdays = employees_info.loc[week_dates, employee]
-    total_week_restdays = week_restdays.value_counts().reindex(["-", "V"], fill_value=0).sum()
+    total_week_restdays = week_restdays.value_counts().reindex([REST_LABEL, VACATION_LABEL], fill_value=0).sum()
 
     return total_week_restdays
 
 
-def count_weekend_restdays(employees_info, employee, year, month):
+def count_weekend_restdays(employees_info, employee, year, month, rules=None):
     """Count the number of weekend restdays for the given employee in the specified month.
 
     :param employees_info: DataFrame with employee information
     :param employee: Employee name or ID
     :param year: Year as an integer
     :param month: Month as an integer
+    :param rules: CompiledRules with the weekend days, defaults to Friday to Sunday
     :return: Number of weekend workdays
     """
-    weekends_df, _ = get_weekends_of_month(year, month)
+    weekends_df, _ = get_weekends_of_month(year, month, rules)
 
     weekend_workdays = employees_info.loc[weekends_df["Date"], employee]
-    total_weekend_workdays = weekend_workdays.value_counts().reindex(["-", "V"], fill_value=0).sum()
+    total_weekend_workdays = weekend_workdays.value_counts().reindex([REST_LABEL, VACATION_LABEL], fill_value=0).sum()
 
     return total_weekend_workdays
 
@@ -219,21 +246,6 @@ def get_previous_day_value(employees_info, employee, date):
     return previous_day_value
 
 
-def skip_employee(one_employee, available_employees, date, num_remaining_weekends, any_employee_rest_in_weekend):
-    """Evaluate if an employee should be skipped based on various conditions.
-
-    :param one_employee: Dictionary with employee information
-    :param available_employees: List of available employees
-    :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
-    :param num_remaining_weekends: Number of remaining weekends in the current month
-    :return: True if the employee should be skipped, False otherwise
-    """
-    if isinstance(date, str):
-        date = pd.Timestamp(date)
-
-    return len(available_employees) > 1 and is_weekend(date) and not any_employee_rest_in_weekend
-
-
 def assign_employee_shift(date, shift, one_employee, all_employees_by_shift, employees_info):
     """Assign a shift to an employee and update the DataFrames.
 
@@ -250,189 +262,229 @@ def assign_employee_shift(date, shift, one_employee, all_employees_by_shift, emp
     employees_info.loc[date, one_employee["employee"]] = shift
 
 
-def sort_available_employees(available_employees, shift, month, data_employee_monthly):
-    """Sort available employees based on specific criteria.
+def is_weekend(date, rules=None):
+    """Check if a given date is a weekend.
 
-    :param available_employees: List of available employees
-    :param shift: Shift to be assigned
-    :return: Sorted list of available employees
+    :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+    :param rules: CompiledRules with the weekend days, defaults to Friday to Sunday
+    :return: True if the date is a weekend, False otherwise
     """
-    return sorted(
-        available_employees,
-        key=lambda x: (
-            x["previous_day_value"] != shift,
-            data_employee_monthly[month][x["employee"]]["rest_weekends"],
-        ),
-        reverse=False,
+    if isinstance(date, str):
+        date = pd.Timestamp(date)
+
+    if rules is not None:
+        return bool(rules.weekend[date.weekday()])
+    return date.weekday() in DEFAULT_WEEKEND_DAYS
+
+
+def create_solver(
+    employees_info, employees, rules, trace=None, history=None, rotation_days=None, beam_width=None, workers=None
+):
+    """Create the solver of a planning.
+
+    :param employees_info: DataFrame with employee information
+    :param employees: List of employees
+    :param rules: CompiledRules
+    :param trace: Optional DecisionTrace receiving the outcome of each candidate evaluation
+    :param history: Optional DataFrame returned by load_previous_planning
+    :param rotation_days: Continue the last rotation_days of history
+    :param beam_width: Create a BeamSolver keeping beam_width partial plannings instead of a ShiftSolver
+    :param workers: Number of worker processes expanding the beam of a BeamSolver
+    :return: ShiftSolver or BeamSolver
+    """
+    dates = pd.DatetimeIndex(employees_info.index)
+    history_grid = None
+    if history is not None and not history.empty:
+        history_dates = pd.date_range(end=dates[0] - pd.Timedelta(days=1), start=history.index[0], freq="D")
+        history = history.reindex(index=history_dates, columns=employees_info.columns, fill_value="")
+        history_grid = rules.encode(history)
+
+    max_hours_year = [rules.max_hours_year * employees[employee]["capacity"] for employee in employees_info.columns]
+    if beam_width is not None:
+        if trace is not None:
+            raise ValueError("The decision trace is not available with beam_width")
+        return BeamSolver(
+            rules.encode(employees_info),
+            dates,
+            max_hours_year,
+            rules,
+            beam_width=beam_width,
+            history=history_grid,
+            rotation_days=rotation_days,
+            workers=workers,
+        )
+    return ShiftSolver(
+        rules.encode(employees_info),
+        dates,
+        max_hours_year,
+        rules,
+        trace=trace,
+        history=history_grid,
+        rotation_days=rotation_days,
     )
 
 
-def assign_available_employees(
-    date,
-    shift,
-    available_employees,
+def load_data_by_date(
     all_employees_by_shift,
-    employees_info,
     employee_restrictions,
-    num_remaining_weekends,
-    any_employee_rest_in_weekend,
-    data_employee_monthly,
+    employees_info,
+    employees,
+    start_date,
+    trace=None,
+    rules=None,
+    history=None,
+    rotation_days=None,
+    beam_width=None,
+    workers=None,
 ):
-    """Assign shifts to available employees.
+    """Load data by date.
 
-    :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
-    :param shift: Shift to be assigned
-    :param available_employees: List of available employees
     :param all_employees_by_shift: DataFrame tracking the number of employees by shift
-    :param employees_info: DataFrame with employee information
     :param employee_restrictions: Dictionary with employee restrictions
-    :param num_remaining_weekends: Number of remaining weekends in the current month
-    """
-    for one_employee in available_employees:
-        if skip_employee(
-            one_employee,
-            available_employees,
-            date,
-            num_remaining_weekends,
-            any_employee_rest_in_weekend.get(shift, False),
-        ):
-            available_employees = [emp for emp in available_employees if emp["employee"] != one_employee["employee"]]
-            if date.weekday() in (4,):
-                saturday = date + timedelta(days=1)
-                sunday = date + timedelta(days=2)
-                employees_info.loc[saturday, one_employee["employee"]] = "-"
-                employees_info.loc[sunday, one_employee["employee"]] = "-"
-                data_employee_monthly[date.month][one_employee["employee"]]["rest_weekends"] += 1
-                any_employee_rest_in_weekend[shift] = True
-            continue
-        assign_employee_shift(date, shift, one_employee, all_employees_by_shift, employees_info)
+    :param employees_info: DataFrame with employee information
+    :param employees: List of employees
+    :param start_date: First date of the year
+    :param trace: Optional DecisionTrace receiving the outcome of each candidate evaluation
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
+    :param history: Optional DataFrame returned by load_previous_planning. It seeds the rolling window,
+        the previous day values and, for days of the same year, the yearly hours
+    :param rotation_days: Continue the last rotation_days of history over the first rotation_days days, trying
+        first the employees that the rotation puts on each shift among otherwise equal candidates
+    :param beam_width: Solve with a BeamSolver keeping beam_width partial plannings instead of the greedy solver.
+        Wider beams take more time and leave fewer under-staffed shifts. Not compatible with trace
+    :param workers: Number of worker processes expanding the beam, used with beam_width
+    :return:
+    """
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
 
-        if all_employees_by_shift.loc[date, shift] >= employee_restrictions["max_persons_per_shift"][shift]:
-            break  # No more employees needed
+    solver = create_solver(employees_info, employees, rules, trace, history, rotation_days, beam_width, workers)
+    grid = solver.solve()
 
+    employees_info.iloc[:, :] = rules.decode(grid)
+    all_employees_by_shift.iloc[:, :] = solver.counts
 
-def is_weekend(date):
-    """Check if a given date is a weekend.
+    return employees_info
 
-    :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
-    :return: True if the date is a weekend (Saturday or Sunday), False otherwise
-    """
-    return date.weekday() in (4, 5, 6)
 
+def iter_planning(
+    all_employees_by_shift,
+    employee_restrictions,
+    employees_info,
+    employees,
+    start_date,
+    rules=None,
+    history=None,
+    rotation_days=None,
+    beam_width=None,
+    workers=None,
+    chunk_days=1,
+    progress=None,
+    stop=None,
+):
+    """Plan day by day, yielding the days as soon as they are final.
 
-def load_data_by_date(all_employees_by_shift, employee_restrictions, employees_info, employees, start_date):
-    """Load data by date.
+    employees_info and all_employees_by_shift are filled as the days are yielded. Breaking out of the loop
+    stops the planning. With beam_width the days are only yielded once the whole planning is solved, and the
+    planning is the one of load_data_by_date.
+
+    Without beam_width the coverage repair runs day by day as the days become final, while load_data_by_date
+    repairs the whole planning at once, filling first the gaps that fewer employees can take. When gaps remain
+    the two plannings can differ, including in the number of under-staffed shifts, so use load_data_by_date when
+    the result must match planning.py.
 
     :param all_employees_by_shift: DataFrame tracking the number of employees by shift
     :param employee_restrictions: Dictionary with employee restrictions
     :param employees_info: DataFrame with employee information
     :param employees: List of employees
     :param start_date: First date of the year
-    :return:
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
+    :param history: Optional DataFrame returned by load_previous_planning
+    :param rotation_days: Continue the last rotation_days of history
+    :param beam_width: Solve with a BeamSolver keeping beam_width partial plannings
+    :param workers: Number of worker processes expanding the beam, used with beam_width
+    :param chunk_days: Number of days of each yielded chunk, 7 for weeks
+    :param progress: Optional function called with the number of days planned and the total number of days
+    :param stop: Optional function called with each pair of chunks, the planning stops when it returns True
+    :return: Generator of (employees_info, all_employees_by_shift) chunks
     """
-    data_employee_monthly = {}
-    any_employee_rest_in_weekend = {}
-    for date in all_employees_by_shift.index:
-        num_remaining_weekends = count_remaining_weekends(date)
-        for shift in all_employees_by_shift.columns:
-            if (
-                all_employees_by_shift.loc[date, shift] >= employee_restrictions["max_persons_per_shift"][shift]
-            ):  # No more employees needed
-                continue
-
-            available_employees = []
-            if date.weekday() in (4,):
-                any_employee_rest_in_weekend[shift] = False
-
-            for employee in employees_info.columns:
-                month = date.month
-                if month not in data_employee_monthly:
-                    data_employee_monthly[month] = {}
-                if employee not in data_employee_monthly[month]:
-                    data_employee_monthly[month][employee] = {
-                        "rest_weekends": 0,
-                    }
-
-                if not employees_info.loc[date, employee] or employees_info.loc[date, employee] == "":
-                    six_days_ago = date - timedelta(days=6)
-                    yesterday = date - timedelta(days=1)
-
-                    last_6_days_employee = employees_info.loc[six_days_ago:date, employee]
-                    previous_day_value = get_previous_day_value(employees_info, employee, date)
-
-                    if yesterday in employees_info.index:
-                        value_yesterday = employees_info.loc[yesterday, employee]
-                    else:
-                        value_yesterday = None
-
-                    total_worked_days_in_6_days = (
-                        last_6_days_employee.value_counts().reindex(["M", "T"], fill_value=0).sum()
-                    )
-
-                    total_sum_m_t = employees_info[employee].isin(["M", "T"]).sum()
-
-                    employee_capacity = next(
-                        emp["capacity"] for key_emp, emp in employees.items() if key_emp == employee
-                    )
-                    if value_yesterday and value_yesterday == "T" and shift == "M":
-                        employees_info.loc[date, employee] = ""
-                    elif (
-                        (total_sum_m_t * employee_restrictions["hours_per_shift"])
-                        >= (employee_restrictions["max_hours_year_employee"] * employee_capacity)
-                    ) or (
-                        ((total_worked_days_in_6_days) * employee_restrictions["hours_per_shift"])
-                        >= (employee_restrictions["max_hours_week_employee"])
-                    ):
-                        employees_info.loc[date, employee] = ""
-                    else:
-                        available_employees.append(
-                            {
-                                "employee": employee,
-                                "previous_day_value": previous_day_value,
-                            }
-                        )
-
-            available_employees = sort_available_employees(available_employees, shift, month, data_employee_monthly)
-
-            assign_available_employees(
-                date,
-                shift,
-                available_employees,
-                all_employees_by_shift,
-                employees_info,
-                employee_restrictions,
-                num_remaining_weekends,
-                any_employee_rest_in_weekend,
-                data_employee_monthly,
-            )
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
+
+    solver = create_solver(
+        employees_info,
+        employees,
+        rules,
+        history=history,
+        rotation_days=rotation_days,
+        beam_width=beam_width,
+        workers=workers,
+    )
+    for planned in solver.stream(chunk_days):
+        rows = slice(planned.first_day, planned.first_day + len(planned.dates))
+        employees_info.iloc[rows, :] = rules.decode(planned.codes)
+        all_employees_by_shift.iloc[rows, :] = planned.counts
+        if progress is not None:
+            progress(rows.stop, solver.num_days)
 
-            num_employees_in_shift = employees_info.loc[date].value_counts().get(shift, 0)
-            if num_employees_in_shift < employee_restrictions["min_persons_per_shift"][shift]:
-                for one_employee in available_employees:
-                    assign_employee_shift(date, shift, one_employee, all_employees_by_shift, employees_info)
-                for employee_key in employees.keys():
-                    num_worked_days_in_shift = (
-                        employees_info.loc[six_days_ago:date, employee_key].value_counts().get(shift, 0)
-                    )
-                    if (
-                        num_worked_days_in_shift > 0
-                        and (num_worked_days_in_shift + 1) * employee_restrictions["hours_per_shift"]
-                        < employee_restrictions["max_hours_week_employee"]
-                        and data_employee_monthly[month][employee_key]["rest_weekends"]
-                        and (employees_info.loc[yesterday, employee_key] == "-" and date.weekday() not in (5, 6))
-                    ):
-                        all_employees_by_shift.loc[date, shift] += 1
-                        employees_info.loc[date, employee_key] = shift
-                    if (
-                        employees_info.loc[date].value_counts().get(shift, 0)
-                        >= employee_restrictions["min_persons_per_shift"][shift]
-                    ):
-                        break
-        for one_employee in employees_info.columns:
-            if employees_info.loc[date, one_employee] == "":
-                employees_info.loc[date, one_employee] = "-"
+        chunk = employees_info.iloc[rows], all_employees_by_shift.iloc[rows]
+        yield chunk
+        if stop is not None and stop(*chunk):
+            return
 
-    return employees_info
+
+def validate_planning(employees_info, employees, rules):
+    """Check a planning against the rules.
+
+    :param employees_info: DataFrame with employee information
+    :param employees: List of employees
+    :param rules: CompiledRules
+    :return: DataFrame with date, employee, shift and rule of each violation
+    """
+    dates = pd.DatetimeIndex(employees_info.index)
+    grid = rules.encode(employees_info)
+    hours = rules.hours[grid]
+    violations = []
+
+    for shift_index, shift in enumerate(rules.shifts):
+        forbidden = rules.forbidden[grid[:-1], shift_index] & (grid[1:] == rules.shift_codes[shift_index])
+        for day, employee in zip(*np.nonzero(forbidden)):
+            violations.append((dates[day + 1], employees_info.columns[employee], shift, "rest_succession"))
+
+        counts = (grid == rules.shift_codes[shift_index]).sum(axis=1)
+        for day in np.flatnonzero(counts < rules.min_persons[shift_index]):
+            violations.append((dates[day], None, shift, "under_coverage"))
+        for day in np.flatnonzero(counts > rules.max_persons[shift_index]):
+            violations.append((dates[day], None, shift, "over_coverage"))
+
+    cumulative = np.vstack([np.zeros((1, hours.shape[1])), np.cumsum(hours, axis=0)])
+    window = rules.window_days
+    window_hours = cumulative[window:] - cumulative[:-window] if len(hours) >= window else hours[:0]
+    for day, employee in zip(*np.nonzero(window_hours > rules.max_hours_week)):
+        violations.append((dates[day + window - 1], employees_info.columns[employee], None, "week_hours"))
+
+    max_hours_year = np.array(
+        [rules.max_hours_year * employees[employee]["capacity"] for employee in employees_info.columns]
+    )
+    for employee in np.flatnonzero(hours.sum(axis=0) > max_hours_year):
+        violations.append((dates[-1], employees_info.columns[employee], None, "year_hours"))
+
+    return pd.DataFrame(violations, columns=["date", "employee", "shift", "rule"])
+
+
+def create_decision_trace(employees_info, all_employees_by_shift):
+    """Create an empty decision trace matching the solver layout.
+
+    :param employees_info: DataFrame with employee information
+    :param all_employees_by_shift: DataFrame tracking the number of employees by shift
+    :return: DecisionTrace
+    """
+    return DecisionTrace(
+        employees_info.index[0],
+        employees_info.columns,
+        all_employees_by_shift.columns,
+        capacity=len(employees_info.index) * len(employees_info.columns) * (len(all_employees_by_shift.columns) + 1),
+    )
 
 
 def modify_index_to_datetime(dataframe):
@@ -471,47 +523,52 @@ def load_translations():
 def create_transposed_dataframe(employees_info, lang="es"):
     """Create a transposed dataframe.
 
+    employees_info is left untouched, the transposed dataframe is built on a read-only transposed view of its values.
+
     :param employees_info:
     :param lang:
     :return:
     """
-    employees_info.index = pd.to_datetime(employees_info.index)
+    dates = pd.DatetimeIndex(pd.to_datetime(employees_info.index))
 
     lang_data = load_translations()
 
-    day_of_month = employees_info.index.day
+    day_of_month = dates.day
     days_of_week_map = {i: lang_data["days_of_week"][i][lang] for i in range(7)}
     months_map = {month: lang_data["months"][month][lang] for month in range(1, 13)}
-    month = employees_info.index.month.map(months_map)
-    day_of_week = employees_info.index.dayofweek.map(days_of_week_map)
+    month = dates.month.map(months_map)
+    day_of_week = dates.dayofweek.map(days_of_week_map)
 
     multi_index_index = pd.MultiIndex.from_arrays([month, day_of_week, day_of_month], names=["", "", ""])
 
-    employees_info.index = multi_index_index
-
-    transposed_employees_info = employees_info.T
+    values = employees_info.to_numpy().T
+    values.flags.writeable = False
+    transposed_employees_info = pd.DataFrame(
+        values, index=employees_info.columns, columns=multi_index_index, copy=False
+    )
 
     return transposed_employees_info
 
 
-def generate_summary(employees, employee_restrictions, transposed_employees_info):
+def generate_summary(employees, employee_restrictions, transposed_employees_info, rules=None):
     """Generate summary.
 
     :param employees:
     :param employee_restrictions:
     :param transposed_employees_info:
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
     :return:
     """
-    transposed_employees_info["THT"] = transposed_employees_info.apply(
-        lambda row: (row.value_counts().get("M", 0) + row.value_counts().get("T", 0) + row.value_counts().get("N", 0))
-        * employee_restrictions["hours_per_shift"],
-        axis=1,
-    )
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
+
+    codes = rules.encode(transposed_employees_info)
+    transposed_employees_info["THT"] = rules.hours[codes].sum(axis=1)
 
     transposed_employees_info["MH"] = transposed_employees_info.index.map(lambda emp: employees[emp]["max_hours_year"])
     transposed_employees_info["Diff"] = transposed_employees_info["MH"] - transposed_employees_info["THT"]
 
-    sum_m_t = transposed_employees_info.apply(lambda col: col.isin(["M", "T"]).sum(), axis=0)
+    sum_m_t = pd.Series(rules.worked[codes].sum(axis=0), index=transposed_employees_info.columns[:-3])
     new_row = pd.Series(sum_m_t, name="Total")
     transposed_employees_info = pd.concat([transposed_employees_info, new_row.to_frame().T])
 
@@ -520,26 +577,30 @@ def generate_summary(employees, employee_restrictions, transposed_employees_info
     return transposed_employees_info
 
 
-def generate_summary_month(employees, employee_restrictions, planning_data):
+def generate_summary_month(employees, employee_restrictions, planning_data, rules=None):
     """Generate summary month.
 
     :param employees:
     :param employee_restrictions:
     :param planning_data:
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
     :return:
     """
-    planning_data["THT"] = planning_data.iloc[1:].apply(
-        lambda row: (row.value_counts().get("M", 0) + row.value_counts().get("T", 0) + row.value_counts().get("N", 0))
-        * employee_restrictions["hours_per_shift"],
-        axis=1,
-    )
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
 
-    sum_m_t = planning_data.apply(lambda col: col.isin(["M", "T", "N"]).sum(), axis=0)
+    codes = rules.encode(planning_data)
+    planning_data["THT"] = pd.Series(rules.hours[codes[1:]].sum(axis=1), index=planning_data.index[1:])
+
+    sum_m_t = pd.Series(rules.worked[codes].sum(axis=0), index=planning_data.columns[:-1])
     new_row = pd.Series(sum_m_t, name="Total")
     planning_data = pd.concat([planning_data, new_row.to_frame().T])
 
 
-def generate_summary_total(employees, employee_restrictions, planning_data):
+def generate_summary_total(employees, employee_restrictions, planning_data, rules=None):
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
+
     total_data = {
         "THT": 0,
         "MHA": 0,
@@ -548,7 +609,7 @@ def generate_summary_total(employees, employee_restrictions, planning_data):
 
     for month in range(1, 13):
         month_str = f"{month:02d}"
-        generate_summary_month(employees, employee_restrictions, planning_data[month_str])
+        generate_summary_month(employees, employee_restrictions, planning_data[month_str], rules)
         total_data["THT"] += planning_data[month_str]["THT"]
 
     total_data["MHA"] = planning_data["01"].index.map(
@@ -564,14 +625,28 @@ def generate_summary_total(employees, employee_restrictions, planning_data):
     return total_data
 
 
-def generate_transposed_excel_with_styles(transposed_employees_info, employee_restrictions, filename):
+def generate_transposed_excel_with_styles(
+    transposed_employees_info, employee_restrictions, filename, rules=None, lang="es", conditional_formatting=False
+):
     """Generate transposed excel with styles.
 
     :param transposed_employees_info:
     :param employee_restrictions:
     :param filename:
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
+    :param lang: Language of the day of week labels
+    :param conditional_formatting: Style with shared named styles and conditional formatting rules
+        instead of styling each cell
     :return:
     """
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
+    highlight_labels = rules.highlight_labels(load_translations(), lang)
+
+    if conditional_formatting:
+        _generate_transposed_excel_with_rules(transposed_employees_info, rules, highlight_labels, filename)
+        return
+
     output_filename = filename
     transposed_employees_info.to_excel(output_filename, sheet_name="Shift Schedule")
 
@@ -615,7 +690,7 @@ def generate_transposed_excel_with_styles(transposed_employees_info, employee_re
 
     for col in worksheet.iter_cols(min_row=2, max_row=worksheet.max_row, min_col=2, max_col=worksheet.max_column):
         day_of_week_cell = col[0]
-        if day_of_week_cell.value in ["S", "D"]:
+        if day_of_week_cell.value in highlight_labels:
             for cell in col:
                 cell.fill = weekend_fill
 
@@ -624,9 +699,7 @@ def generate_transposed_excel_with_styles(transposed_employees_info, employee_re
             cell.border = thin_border
             cell.alignment = Alignment(horizontal="center")
 
-    min_persons_day = (
-        employee_restrictions["min_persons_per_shift"]["M"] + employee_restrictions["min_persons_per_shift"]["T"]
-    )
+    min_persons_day = rules.min_persons.sum()
 
     red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
     total_row = worksheet.max_row
@@ -637,6 +710,224 @@ def generate_transposed_excel_with_styles(transposed_employees_info, employee_re
     workbook.save(output_filename)
 
 
+def generate_hours_summary(employees_info, employees, rules):
+    """Summarize the planning of each employee.
+
+    :param employees_info: DataFrame with employee information
+    :param employees: List of employees
+    :param rules: CompiledRules
+    :return: DataFrame with a row per employee: days of each shift, vacation days, THT, MH and Diff
+    """
+    codes = rules.encode(employees_info)
+    summary = pd.DataFrame(
+        (codes[:, :, None] == rules.shift_codes).sum(axis=0), index=employees_info.columns, columns=list(rules.shifts)
+    )
+    summary[VACATION_LABEL] = (codes == rules.code(VACATION_LABEL)).sum(axis=0)
+    summary["THT"] = rules.hours[codes].sum(axis=0)
+    summary["MH"] = [employees[employee]["max_hours_year"] for employee in employees_info.columns]
+    summary["Diff"] = summary["MH"] - summary["THT"]
+    return summary
+
+
+def export_styled(employees_info, employees, employee_restrictions, filename, rules=None, lang="es"):
+    """Transpose, summarize and write the styled planning.
+
+    :param employees_info: DataFrame with employee information, left untouched
+    :param employees: List of employees
+    :param employee_restrictions: Dictionary with employee restrictions
+    :param filename: Output file
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
+    :param lang: Language of the month and day of week labels
+    """
+    transposed_employees_info = create_transposed_dataframe(employees_info, lang)
+    transposed_employees_info = generate_summary(employees, employee_restrictions, transposed_employees_info, rules)
+    generate_transposed_excel_with_styles(transposed_employees_info, employee_restrictions, filename, rules, lang)
+
+
+def export_summary(employees_info, employees, employee_restrictions, filename, rules=None):
+    """Write the hours summary and the rule violations of the planning.
+
+    :param employees_info: DataFrame with employee information, left untouched
+    :param employees: List of employees
+    :param employee_restrictions: Dictionary with employee restrictions
+    :param filename: Output file
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
+    """
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
+
+    violations = validate_planning(employees_info, employees, rules)
+    violations["date"] = pd.to_datetime(violations["date"]).dt.strftime("%Y-%m-%d")
+    with pd.ExcelWriter(filename) as writer:
+        generate_hours_summary(employees_info, employees, rules).to_excel(writer, sheet_name="Summary")
+        violations.to_excel(writer, sheet_name="Violations", index=False)
+
+
+def export_planning(employees_info, employees, employee_restrictions, files, rules=None, lang="es", workers=None):
+    """Write the plain, styled and summary exports of a planning at the same time, each in a worker process.
+
+    Every export reads employees_info without modifying it and writes its own file.
+
+    :param employees_info: DataFrame with employee information
+    :param employees: List of employees
+    :param employee_restrictions: Dictionary with employee restrictions
+    :param files: Dictionary with the "plain", "styled" and "summary" output files, missing exports are skipped
+    :param rules: CompiledRules, compiled from employee_restrictions when not given
+    :param lang: Language of the month and day of week labels
+    :param workers: Number of worker processes, one per export by default
+    """
+    if rules is None:
+        rules = compile_rules(employee_restrictions)
+
+    exports = [name for name in ("styled", "plain", "summary") if files.get(name)]
+    with ProcessPoolExecutor(max_workers=workers or len(exports) or 1) as executor:
+        futures = []
+        for name in exports:  # Slowest export first
+            if name == "styled":
+                arguments = (export_styled, employees_info, employees, employee_restrictions, files[name], rules, lang)
+            elif name == "plain":
+                arguments = (generate_excel, employees_info, files[name])
+            else:
+                arguments = (export_summary, employees_info, employees, employee_restrictions, files[name], rules)
+            futures.append(executor.submit(*arguments))
+        for future in futures:
+            future.result()
+
+
+def register_named_styles(workbook):
+    """Register the shared named styles used by the conditional formatting exports.
+
+    The borders of these exports come from add_border_rule, so the named styles only center the values.
+
+    :param workbook:
+    """
+    named_styles = [
+        NamedStyle(name=CELL_STYLE, alignment=Alignment(horizontal="center")),
+        NamedStyle(
+            name=HEADER_STYLE,
+            alignment=Alignment(horizontal="center"),
+            fill=PatternFill(start_color="0099FF", end_color="0099FF", fill_type="solid"),
+            font=Font(color="FFFFFF", bold=True),
+        ),
+    ]
+    for named_style in named_styles:
+        if named_style.name not in workbook.named_styles:
+            workbook.add_named_style(named_style)
+
+
+def style_values(worksheet, max_row, max_col):
+    """Apply the header style to the first row and the cell style to the other cells holding a value.
+
+    Alignment cannot be expressed by conditional formatting and column styles do not reach the written cells,
+    so the values are the only cells styled one by one.
+
+    :param worksheet:
+    :param max_row: Last row of the range
+    :param max_col: Last column of the range
+    """
+    for column in range(1, max_col + 1):
+        worksheet.cell(row=1, column=column).style = HEADER_STYLE
+    for row in worksheet.iter_rows(min_row=2, max_row=max_row, min_col=1, max_col=max_col):
+        for cell in row:
+            if cell.value is not None:
+                cell.style = CELL_STYLE
+
+
+def add_border_rule(worksheet, max_row, max_col):
+    """Draw the thin border of every cell of the range starting at A1 with one conditional formatting rule.
+
+    :param worksheet:
+    :param max_row: Last row of the range
+    :param max_col: Last column of the range
+    """
+    side = Side(style="thin")
+    worksheet.conditional_formatting.add(
+        f"A1:{get_column_letter(max_col)}{max_row}",
+        FormulaRule(formula=["TRUE"], border=Border(left=side, right=side, top=side, bottom=side)),
+    )
+
+
+def set_column_widths(worksheet, widths):
+    """Set the column widths with one column range per run of equal widths.
+
+    :param worksheet:
+    :param widths: Width of each column, starting at column A
+    """
+    start = 0
+    for end in range(1, len(widths) + 1):
+        if end == len(widths) or widths[end] != widths[start]:
+            letter = get_column_letter(start + 1)
+            worksheet.column_dimensions[letter] = ColumnDimension(
+                worksheet, index=letter, min=start + 1, max=end, width=widths[start]
+            )
+            start = end
+
+
+def add_weekend_rule(worksheet, labels_row, min_col, max_col, max_row, highlight_labels, color):
+    """Fill the columns whose day of week label is highlighted, with one conditional formatting rule.
+
+    :param worksheet:
+    :param labels_row: Row with the day of week labels
+    :param min_col: First column of the range
+    :param max_col: Last column of the range
+    :param max_row: Last row of the range
+    :param highlight_labels: Day of week labels to fill
+    :param color: Fill color
+    """
+    first_letter = get_column_letter(min_col)
+    conditions = ",".join(f'{first_letter}${labels_row}="{label}"' for label in sorted(highlight_labels))
+    worksheet.conditional_formatting.add(
+        f"{first_letter}{labels_row}:{get_column_letter(max_col)}{max_row}",
+        FormulaRule(
+            formula=[f"OR({conditions})"],
+            fill=PatternFill(start_color=color, end_color=color, fill_type="solid"),
+        ),
+    )
+
+
+def _generate_transposed_excel_with_rules(transposed_employees_info, rules, highlight_labels, filename):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = "Shift Schedule"
+    register_named_styles(workbook)
+
+    columns = transposed_employees_info.columns
+    levels = [columns.get_level_values(level) for level in range(columns.nlevels)]
+    num_columns = len(columns) + 1
+    num_rows = columns.nlevels + len(transposed_employees_info.index)
+
+    for level in levels:
+        worksheet.append([None] + [value if value != "" else None for value in level])
+    for label, values in zip(transposed_employees_info.index, transposed_employees_info.to_numpy(dtype=object)):
+        worksheet.append([label] + [None if pd.isna(value) else value for value in values])
+
+    if columns.nlevels > 1:
+        start = 0
+        for end in range(1, len(levels[0]) + 1):
+            if end == len(levels[0]) or levels[0][end] != levels[0][start]:
+                if end - start > 1:
+                    worksheet.merge_cells(start_row=1, start_column=start + 2, end_row=1, end_column=end + 1)
+                start = end
+
+    style_values(worksheet, num_rows, num_columns)
+    set_column_widths(worksheet, [7] + [3] * (num_columns - 4) + [7] * 3)
+
+    # The first rule added wins where fills overlap, so the under-staffed totals stay red on weekend columns
+    total_row = num_rows
+    first_letter = get_column_letter(2)
+    worksheet.conditional_formatting.add(
+        f"{first_letter}{total_row}:{get_column_letter(num_columns)}{total_row}",
+        FormulaRule(
+            formula=[f"AND(ISNUMBER({first_letter}{total_row}),{first_letter}{total_row}<{rules.min_persons.sum()})"],
+            fill=PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"),
+        ),
+    )
+    add_weekend_rule(worksheet, 2, 2, num_columns, num_rows, highlight_labels, "FFFF00")
+    add_border_rule(worksheet, num_rows, num_columns)
+
+    workbook.save(filename)
+
+
 def assign_vacations(employees_info, vacations_file):
     """Assign vacations to employees.
 
@@ -672,14 +963,150 @@ def load_planning_from_yaml(employees_info, planning_file):
                     employees_info.loc[day, employee] = shift
 
 
-def load_planning_from_xlsx(employees_info, planning_file):
+def load_planning_from_xlsx(employees_info, planning_file, year=None):
     """Load planning from an Excel file.
 
     :param employees_info:
     :param planning_file:
+    :param year: Year of the planning, needed for files written by generate_transposed_excel_with_styles
+    """
+    planning = read_planning(planning_file, year)
+    planning = planning.reindex(index=employees_info.index.intersection(planning.index))
+    planning = planning.reindex(columns=employees_info.columns.intersection(planning.columns))
+
+    for employee in planning.columns:
+        assigned = planning[employee][planning[employee] != ""]
+        employees_info.loc[assigned.index, employee] = assigned
+
+
+def read_planning(planning_file, year=None):
+    """Read a planning as a DataFrame with a row per date and a column per employee.
+
+    Supported files are data.yaml, data.xlsx and the workbooks written by generate_excel,
+    generate_transposed_excel_with_styles and export_month. Days without information are empty strings.
+
+    :param planning_file: Path to the planning file
+    :param year: Year of the planning, needed for files written by generate_transposed_excel_with_styles
+        and export_month
+    :return: DataFrame with the planning
     """
+    if planning_file.endswith((".yaml", ".yml")):
+        with open(planning_file) as file:
+            shifts = yaml.safe_load(file)
+
+        planning = {}
+        for day, shifts_info in shifts.items():
+            for shift, employees in shifts_info.items():
+                for employee in employees or []:
+                    planning.setdefault(employee, {})[pd.Timestamp(day)] = shift
+        planning = pd.DataFrame(planning)
+    else:
+        sheets = pd.read_excel(planning_file, sheet_name=None, header=None, na_filter=False)
+        if "Shift Schedule" in sheets:
+            planning = _read_shift_schedule(sheets["Shift Schedule"], year)
+        elif all(name.isdigit() for name in sheets):
+            planning = pd.concat([_read_month_sheet(month, sheet) for month, sheet in sheets.items()])
+        else:
+            planning = _read_exported_months(sheets, year)
+
+    planning = planning.sort_index().fillna("")
+    planning.index = pd.DatetimeIndex(planning.index)
+    return planning
+
+
+def _read_shift_schedule(sheet, year):
+    if str(sheet.iat[1, 0]).strip():
+        planning = sheet.iloc[1:, 1:]
+        planning.index = pd.to_datetime(sheet.iloc[1:, 0])
+        planning.columns = sheet.iloc[0, 1:]
+        return planning
+
+    if year is None:
+        raise ValueError("The year is needed to read a transposed planning")
+
+    months = _month_numbers()
+    month_names = sheet.iloc[0, 1:].replace("", np.nan).ffill()
+    days = sheet.iloc[2, 1:]
+    is_day = month_names.str.lower().isin(months) & days.map(lambda day: str(day).isdigit())
+    employees = sheet.iloc[3:, 0]
+    employees = employees[(employees != "") & (employees != "Total")]
+
+    planning = sheet.loc[employees.index, is_day[is_day].index].T
+    planning.index = [
+        pd.Timestamp(year=year, month=months[month.lower()], day=int(day))
+        for month, day in zip(month_names[is_day], days[is_day])
+    ]
+    planning.columns = employees
+    return planning
+
+
+def _month_numbers():
+    months = {}
+    for number, names in load_translations()["months"].items():
+        for name in names.values():
+            months[name.lower()] = number
+    return months
+
+
+def _read_exported_months(sheets, year):
+    months = _month_numbers()
+    unknown = [name for name in sheets if name != "Total" and name.lower() not in months]
+    if unknown:
+        raise ValueError(f"Unsupported planning workbook, unknown sheets {unknown}")
+    if year is None:
+        raise ValueError("The year is needed to read a planning written by export_month")
+
+    plannings = []
+    for name, sheet in sheets.items():
+        if name == "Total":
+            continue
+        # Rows written by export_month: month name, day numbers, day of week labels and one row per employee
+        days = sheet.iloc[1, 1:]
+        days = days[days.map(lambda day: str(day).isdigit())]
+        employees = sheet.iloc[3:, 0]
+        employees = employees[employees != ""]
+
+        planning = sheet.loc[employees.index, days.index].T
+        planning.index = [pd.Timestamp(year=year, month=months[name.lower()], day=int(day)) for day in days]
+        planning.columns = employees
+        plannings.append(planning)
+    return pd.concat(plannings)
+
+
+def _read_month_sheet(month, sheet):
+    employees = sheet.iloc[2:, 0]
+    employees = employees[employees != ""]
+    planning = sheet.loc[employees.index, 1:].T
+
+    # Like export_month, only the day of the column headers is used, the month is the sheet name
+    dates = pd.to_datetime(sheet.iloc[0, 1:], format="%d/%m/%y")
+    year = dates.dt.year.mode()[0]
+    planning.index = [pd.Timestamp(year=year, month=int(month), day=day) for day in dates.dt.day]
+    planning.columns = employees
+    return planning
+
+
+def load_previous_planning(planning_file, start_date, num_days=None, year=None):
+    """Load the tail of the planning of the previous period, to warm start the solver.
+
+    :param planning_file: Path to a planning file supported by read_planning
+    :param start_date: First date of the new planning
+    :param num_days: Number of days to keep before start_date, all of them when not given
+    :param year: Year of the previous planning, needed for files written by generate_transposed_excel_with_styles
+    :return: DataFrame with a row per day, ending the day before start_date
+    """
+    planning = read_planning(planning_file, year)
+    start_date = pd.Timestamp(start_date)
+    planning = planning[planning.index < start_date]
+    if planning.empty:
+        return planning
+
+    dates = pd.date_range(start=planning.index[0], end=start_date - pd.Timedelta(days=1), freq="D")
+    planning = planning.reindex(dates, fill_value="")
+    if num_days is not None:
+        planning = planning.iloc[-num_days:]
 
-    pass
+    return planning
 
 
 def load_employees_from_yaml(employees_file, employee_restrictions):
@@ -708,13 +1135,21 @@ def load_employees_from_yaml(employees_file, employee_restrictions):
     return employees
 
 
-def export_month(workbook, month_number, planning_data):
+def export_month(workbook, month_number, planning_data, rules=None, lang="es", conditional_formatting=False):
     """Export month.
 
     :param workbook:
     :param month_number:
     :param planning_data:
+    :param rules: Optional CompiledRules with the highlighted days, defaults to Saturday and Sunday
+    :param lang: Language of the day of week labels
+    :param conditional_formatting: Style with shared named styles and conditional formatting rules
+        instead of styling each cell
     """
+    highlight_days = rules.highlight_days if rules is not None else DEFAULT_HIGHLIGHT_DAYS
+    lang_data = load_translations()
+    highlight_labels = {lang_data["days_of_week"][day][lang] for day in highlight_days}
+
     month = str(datetime.strptime(month_number, "%m").strftime("%B")).title()
 
     df = planning_data[month_number]
@@ -725,6 +1160,10 @@ def export_month(workbook, month_number, planning_data):
     worksheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(df.columns) + 1)
     worksheet.cell(row=1, column=1, value=month)
 
+    if conditional_formatting:
+        _export_month_with_rules(workbook, worksheet, df, highlight_labels)
+        return
+
     r_idx = 2
     for row in dataframe_to_rows(df, index=True, header=True):
         if isinstance(row, FrozenList):
@@ -782,7 +1221,7 @@ def export_month(workbook, month_number, planning_data):
 
     for col in worksheet.iter_cols(min_row=3, max_row=worksheet.max_row, min_col=2, max_col=worksheet.max_column):
         day_of_week_cell = col[0]
-        if day_of_week_cell.value in ["S", "D"]:
+        if day_of_week_cell.value in highlight_labels:
             for cell in col:
                 cell.fill = weekend_fill
 
@@ -792,14 +1231,38 @@ def export_month(workbook, month_number, planning_data):
             cell.alignment = Alignment(horizontal="center")
 
 
-def add_total_data(workbook, total_data):
+def _export_month_with_rules(workbook, worksheet, df, highlight_labels):
+    register_named_styles(workbook)
+
+    for row in dataframe_to_rows(df, index=True, header=True):
+        if not isinstance(row, FrozenList):
+            worksheet.append(row)
+
+    num_columns = len(df.columns) + 1
+    style_values(worksheet, worksheet.max_row, num_columns)
+    set_column_widths(worksheet, [3] * (num_columns - 1) + [7])
+
+    add_weekend_rule(worksheet, 3, 2, num_columns, worksheet.max_row, highlight_labels, "9CCCE8")
+    add_border_rule(worksheet, worksheet.max_row, num_columns)
+
+
+def add_total_data(workbook, total_data, conditional_formatting=False):
     """Add total data.
 
     :param workbook:
     :param total_data:
+    :param conditional_formatting: Style with shared named styles instead of styling each cell
     """
     worksheet = workbook.create_sheet(title="Total")
 
+    if conditional_formatting:
+        register_named_styles(workbook)
+        for row in dataframe_to_rows(total_data, index=False, header=True):
+            worksheet.append(row)
+        style_values(worksheet, worksheet.max_row, worksheet.max_column)
+        add_border_rule(worksheet, worksheet.max_row, worksheet.max_column)
+        return
+
     for r_idx, row in enumerate(dataframe_to_rows(total_data, index=False, header=True), 1):
         for c_idx, value in enumerate(row, 1):
             cell = worksheet.cell(row=r_idx, column=c_idx, value=value)
@@ -16,12 +16,12 @@ The main function performs the following steps:
     4. Generates employee information and dates.
     5. Initializes employees by shifts.
     6. Assigns vacations to employees.
-    7. Loads data by date for all employees by shift.
+    7. Loads data by date for all employees by shift, warm started from the previous year output when it exists
+       and with the beam search solver when config.json sets solver.beam_width, expanded in solver.workers
+       processes when given.
     8. Modifies the index of dataframes to datetime.
-    9. Generates an Excel file with employee information.
-    10. Creates a transposed dataframe of employee information.
-    11. Generates a summary of the transposed employee information.
-    12. Generates a styled Excel file with the transposed and summarized employee information.
+    9. Writes at the same time, each in its own file, the Excel file with employee information, the styled Excel
+       file with the transposed and summarized employee information and the hours summary.
 """
 
 import os
@@ -29,16 +29,15 @@ import os
 from employee import (
     assign_vacations,
     create_employees_with_dates,
-    create_transposed_dataframe,
-    generate_excel,
-    generate_summary,
-    generate_transposed_excel_with_styles,
+    export_planning,
     init_employees_by_shifts,
     load_config,
     load_data_by_date,
     load_employees_from_yaml,
+    load_previous_planning,
     modify_index_to_datetime,
 )
+from rules import compile_rules
 
 
 def main():
@@ -47,28 +46,48 @@ def main():
     script_dir = os.path.abspath("../../")
     output_dir = os.path.join(script_dir, "output")
     output_file = os.path.join(output_dir, str(year), case, "generated_from_script.xlsx")
+    plain_output_file = os.path.join(output_dir, str(year), case, "generated_from_script_without_styles.xlsx")
+    summary_output_file = os.path.join(output_dir, str(year), case, "generated_from_script_summary.xlsx")
     employees_file = os.path.join(script_dir, "data", "2025", case, "employees.yaml")
     vacations_file = os.path.join(script_dir, "data", "2025", case, "vacations.yaml")
     config_file = os.path.join(script_dir, "data", "2025", case, "config.json")
+    previous_output_file = os.path.join(output_dir, str(year - 1), case, "generated_from_script.xlsx")
 
     config = load_config(config_file)
     employee_restrictions = config["employee_restrictions"]
+    rules = compile_rules(employee_restrictions, config.get("rules"))
 
     start_date = f"{year}-01-01"
     employees = load_employees_from_yaml(employees_file, employee_restrictions)
     employees_info, dates = create_employees_with_dates(start_date, 365, employees)
-    all_employees_by_shift = init_employees_by_shifts(dates, employee_restrictions)
+    all_employees_by_shift = init_employees_by_shifts(dates, employee_restrictions, rules)
     assign_vacations(employees_info, vacations_file)
-    load_data_by_date(all_employees_by_shift, employee_restrictions, employees_info, employees, start_date)
-    modify_index_to_datetime(all_employees_by_shift)
-    modify_index_to_datetime(employees_info)
 
-    generate_excel(employees_info, output_file)
+    history = None
+    if os.path.exists(previous_output_file):
+        history = load_previous_planning(previous_output_file, start_date, rules.window_days, year=year - 1)
 
-    transposed_employees_info = create_transposed_dataframe(employees_info)
-    transposed_employees_info = generate_summary(employees, employee_restrictions, transposed_employees_info)
+    load_data_by_date(
+        all_employees_by_shift,
+        employee_restrictions,
+        employees_info,
+        employees,
+        start_date,
+        rules=rules,
+        history=history,
+        beam_width=config.get("solver", {}).get("beam_width"),
+        workers=config.get("solver", {}).get("workers"),
+    )
+    modify_index_to_datetime(all_employees_by_shift)
+    modify_index_to_datetime(employees_info)
 
-    generate_transposed_excel_with_styles(transposed_employees_info, employee_restrictions, output_file)
+    export_planning(
+        employees_info,
+        employees,
+        employee_restrictions,
+        {"plain": plain_output_file, "styled": output_file, "summary": summary_output_file},
+        rules,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+"""Rules module.
+
+Compiles the rule specification of config.json (shifts, hours, forbidden
+successions, weekend days and rest requirements) into integer codes, masks and
+lookup tables shared by the solver, the validator and the exporters.
+"""
+
+import numpy as np
+import pandas as pd
+
+EMPTY = 0
+REST = 1
+VACATION = 2
+MISSING = 3
+FIRST_SHIFT = 4
+
+EMPTY_LABEL = ""
+REST_LABEL = "-"
+VACATION_LABEL = "V"
+
+MAX_CODES = 64
+
+DEFAULT_WEEKEND_DAYS = (4, 5, 6)
+DEFAULT_WEEKEND_START_DAY = 4
+DEFAULT_HIGHLIGHT_DAYS = (5, 6)
+DEFAULT_FORBIDDEN_SUCCESSIONS = (("T", "M"),)
+DEFAULT_WINDOW_DAYS = 7
+
+
+class CompiledRules:
+    """Rule specification compiled into lookup tables.
+
+    Cell values are integer codes: EMPTY, REST, VACATION and MISSING are fixed,
+    shifts start at FIRST_SHIFT in configuration order, and any other label
+    found in a planning gets the next free code.
+
+    :param shifts: Shift labels in scheduling order
+    :param shift_hours: Hours of each shift
+    :param forbidden_successions: Pairs (previous shift, shift) that cannot be chained
+    :param weekend_days: Weekdays (0 is Monday) considered weekend
+    :param weekend_start_day: Weekday on which the weekend rest is decided
+    :param highlight_days: Weekdays highlighted in the exports
+    :param window_days: Length of the rolling window used for the weekly hours
+    :param min_persons: Minimum number of persons of each shift
+    :param max_persons: Maximum number of persons of each shift
+    :param max_hours_week: Maximum hours worked in the rolling window
+    :param max_hours_year: Maximum hours worked in the year for a full-time employee
+    :param min_weekend_rest: Minimum number of weekends without work of each employee per month
+    """
+
+    def __init__(
+        self,
+        shifts,
+        shift_hours,
+        forbidden_successions,
+        weekend_days,
+        weekend_start_day,
+        highlight_days,
+        window_days,
+        min_persons,
+        max_persons,
+        max_hours_week,
+        max_hours_year,
+        min_weekend_rest=0,
+    ):
+        self.shifts = tuple(shifts)
+        self.num_shifts = len(self.shifts)
+        self.labels = [EMPTY_LABEL, REST_LABEL, VACATION_LABEL, np.nan, *self.shifts]
+        self.codes = {label: code for code, label in enumerate(self.labels) if code != MISSING}
+        self.shift_codes = np.arange(FIRST_SHIFT, FIRST_SHIFT + self.num_shifts, dtype=np.int8)
+
+        self.worked = np.zeros(MAX_CODES, dtype=bool)
+        self.worked[self.shift_codes] = True
+        self.hours = np.zeros(MAX_CODES, dtype=np.float64)
+        self.hours[self.shift_codes] = shift_hours
+
+        self.forbidden_successions = tuple(tuple(pair) for pair in forbidden_successions)
+        self.forbidden = np.zeros((MAX_CODES, self.num_shifts), dtype=bool)
+        for previous_shift, shift in self.forbidden_successions:
+            if previous_shift in self.codes and shift in self.shifts:
+                self.forbidden[self.codes[previous_shift], self.shifts.index(shift)] = True
+
+        self.weekend_days = tuple(weekend_days)
+        self.weekend = np.zeros(7, dtype=bool)
+        self.weekend[list(self.weekend_days)] = True
+        self.weekend_start_day = weekend_start_day
+        self.weekend_rest_offsets = []
+        offset = 1
+        while offset < 7 and self.weekend[(weekend_start_day + offset) % 7]:
+            self.weekend_rest_offsets.append(offset)
+            offset += 1
+        self.weekend_tail = self.weekend.copy()
+        self.weekend_tail[weekend_start_day] = False
+
+        self.highlight_days = tuple(highlight_days)
+        self.highlight = np.zeros(7, dtype=bool)
+        self.highlight[list(self.highlight_days)] = True
+
+        self.window_days = window_days
+        self.min_persons = np.asarray(min_persons, dtype=np.int64)
+        self.max_persons = np.asarray(max_persons, dtype=np.int64)
+        self.max_hours_week = max_hours_week
+        self.max_hours_year = max_hours_year
+        self.min_weekend_rest = min_weekend_rest
+
+    def code(self, label):
+        """Integer code of a cell label, registering unknown labels.
+
+        :param label: Cell value
+        :return: Integer code
+        """
+        if not isinstance(label, str) and pd.isna(label):
+            return MISSING
+        code = self.codes.get(label)
+        if code is None:
+            if len(self.labels) == MAX_CODES:
+                raise ValueError(f"Too many different values in planning, unknown value {label!r}")
+            code = len(self.labels)
+            self.labels.append(label)
+            self.codes[label] = code
+        return code
+
+    def encode(self, values):
+        """Encode cell labels into integer codes.
+
+        :param values: DataFrame or array of cell labels
+        :return: numpy int8 array with the same shape
+        """
+        values = np.asarray(values, dtype=object)
+        positions, uniques = pd.factorize(values.ravel(), use_na_sentinel=False)
+        lookup = np.fromiter((self.code(label) for label in uniques), dtype=np.int8, count=len(uniques))
+        return lookup[positions].reshape(values.shape)
+
+    def decode(self, grid):
+        """Decode integer codes into cell labels.
+
+        :param grid: numpy array of codes
+        :return: numpy object array with the same shape
+        """
+        return np.asarray(self.labels, dtype=object)[grid]
+
+    def worked_hours(self, values):
+        """Hours worked for each cell.
+
+        :param values: DataFrame or array of cell labels
+        :return: numpy float array with the same shape
+        """
+        return self.hours[self.encode(values)]
+
+    def highlight_labels(self, lang_data, lang):
+        """Day of week labels of the highlighted days.
+
+        :param lang_data: Translations loaded with load_translations
+        :param lang: Language code
+        :return: Set of labels
+        """
+        return {lang_data["days_of_week"][day][lang] for day in self.highlight_days}
+
+
+def compile_rules(employee_restrictions, rules=None):
+    """Compile the rule specification.
+
+    Missing entries fall back to employee_restrictions and to the historical
+    M/T rules: T cannot be followed by M, Friday to Sunday is weekend and the
+    weekly hours are checked over a rolling window of 7 days.
+
+    :param employee_restrictions: Dictionary with employee restrictions
+    :param rules: Dictionary with the "rules" section of config.json
+    :return: CompiledRules
+    """
+    rules = rules or {}
+
+    shifts_spec = rules.get("shifts") or {
+        shift: {"hours": employee_restrictions["hours_per_shift"]} for shift in employee_restrictions["shifts"]
+    }
+    shifts = list(shifts_spec)
+    shift_hours = [
+        (shifts_spec[shift] or {}).get("hours", employee_restrictions["hours_per_shift"]) for shift in shifts
+    ]
+    rest = rules.get("rest", {})
+
+    return CompiledRules(
+        shifts=shifts,
+        shift_hours=shift_hours,
+        forbidden_successions=rules.get("forbidden_successions", DEFAULT_FORBIDDEN_SUCCESSIONS),
+        weekend_days=rules.get("weekend_days", DEFAULT_WEEKEND_DAYS),
+        weekend_start_day=rules.get("weekend_start_day", DEFAULT_WEEKEND_START_DAY),
+        highlight_days=rules.get("highlight_days", DEFAULT_HIGHLIGHT_DAYS),
+        window_days=rest.get("window_days", DEFAULT_WINDOW_DAYS),
+        min_persons=[employee_restrictions["min_persons_per_shift"].get(shift, 0) for shift in shifts],
+        max_persons=[employee_restrictions["max_persons_per_shift"].get(shift, 0) for shift in shifts],
+        max_hours_week=employee_restrictions["max_hours_week_employee"],
+        max_hours_year=employee_restrictions["max_hours_year_employee"],
+        min_weekend_rest=employee_restrictions.get("min_weekend_rest_month_employee", 0),
+    )
@@ -0,0 +1,204 @@
+"""Sizing module.
+
+Finds the smallest roster, in number of employees and capacity mix, whose
+planning has no under-staffed day. Rosters failing the hours and coverage
+lower bounds are discarded without solving, the others are solved
+concurrently in worker processes with the solver used by planning.py.
+
+Usage:
+    python sizing.py case_1 --capacities 1 0.5 --workers 4 --output employees.yaml
+"""
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations_with_replacement, islice
+
+import numpy as np
+import yaml
+
+try:
+    from .employee import create_employees_with_dates, create_solver, load_config
+    from .rules import compile_rules
+except ImportError:
+    from employee import create_employees_with_dates, create_solver, load_config
+    from rules import compile_rules
+
+
+def create_roster(capacities, employee_restrictions):
+    """Create the employees of a roster.
+
+    :param capacities: Capacity of each employee
+    :param employee_restrictions: Dictionary with employee restrictions
+    :return: Dictionary of employees like load_employees_from_yaml
+    """
+    employees = {}
+    for number, capacity in enumerate(capacities, start=1):
+        employees[f"E{number}"] = {
+            "capacity": capacity,
+            "name": f"E{number}",
+            "max_hours_year": employee_restrictions["max_hours_year_employee"] * capacity,
+            "max_hours_week": employee_restrictions["max_hours_week_employee"] * capacity,
+        }
+    return employees
+
+
+def roster_lower_bounds(rules, num_days):
+    """Lower bounds of a roster, independent of the solver.
+
+    :param rules: CompiledRules
+    :param num_days: Number of days of the planning
+    :return: Tuple (minimum number of employees, hours needed in the planning, maximum hours of a full-time employee)
+    """
+    shift_hours = rules.hours[rules.shift_codes]
+    persons_per_day = int(rules.min_persons.sum())
+    shifts_per_window = math.floor(rules.max_hours_week / shift_hours.min()) if len(shift_hours) else 0
+    window_shifts = min(rules.window_days, num_days) * persons_per_day
+    min_employees = max(persons_per_day, math.ceil(window_shifts / shifts_per_window) if shifts_per_window else 0)
+
+    hours_needed = num_days * float((rules.min_persons * shift_hours).sum())
+    hours_per_employee = min(rules.max_hours_year, rules.max_hours_week * math.ceil(num_days / rules.window_days))
+    return min_employees, hours_needed, hours_per_employee
+
+
+def candidate_rosters(rules, num_days, capacities, max_employees):
+    """Rosters passing the lower bounds, smallest first.
+
+    Rosters are ordered by number of employees and then by total capacity.
+
+    :param rules: CompiledRules
+    :param num_days: Number of days of the planning
+    :param capacities: Capacities allowed in the roster, 1 for full-time employees
+    :param max_employees: Largest number of employees tried
+    :return: Generator of tuples with the capacity of each employee, highest capacities first
+    """
+    min_employees, hours_needed, hours_per_employee = roster_lower_bounds(rules, num_days)
+    capacities = sorted(set(capacities), reverse=True)
+    for size in range(max(min_employees, 1), max_employees + 1):
+        rosters = sorted(combinations_with_replacement(capacities, size), key=sum)
+        for roster in rosters:
+            hours = sum(min(capacity * rules.max_hours_year, hours_per_employee) for capacity in roster)
+            if hours >= hours_needed:
+                yield roster
+
+
+def first_under_staffed_day(employee_restrictions, rules_spec, start_date, num_days, roster, beam_width=None):
+    """Plan a roster like planning.py and find its first under-staffed day.
+
+    :param employee_restrictions: Dictionary with employee restrictions
+    :param rules_spec: Dictionary with the "rules" section of config.json
+    :param start_date: First date of the planning
+    :param num_days: Number of days of the planning
+    :param roster: Capacity of each employee
+    :param beam_width: Solve with a BeamSolver keeping beam_width partial plannings
+    :return: First under-staffed date as a string in 'YYYY-MM-DD' format, None when every day is staffed
+    """
+    rules = compile_rules(employee_restrictions, rules_spec)
+    employees = create_roster(roster, employee_restrictions)
+    employees_info, _ = create_employees_with_dates(start_date, num_days, employees)
+
+    solver = create_solver(employees_info, employees, rules, beam_width=beam_width)
+    solver.solve()
+    under_staffed = (solver.counts < rules.min_persons).any(axis=1)
+    if under_staffed.any():
+        return str(solver.dates[np.argmax(under_staffed)].date())
+    return None
+
+
+def size_roster(
+    employee_restrictions,
+    rules_spec=None,
+    start_date="2025-01-01",
+    num_days=365,
+    capacities=(1,),
+    max_employees=50,
+    workers=None,
+    beam_width=None,
+):
+    """Find the smallest roster without under-staffed days.
+
+    Rosters are tried by number of employees and then by total capacity, as
+    many at a time as there are workers. Every day of the returned roster
+    meets min_persons_per_shift with the solver, which is an upper bound of
+    the true minimum.
+
+    :param employee_restrictions: Dictionary with employee restrictions
+    :param rules_spec: Dictionary with the "rules" section of config.json
+    :param start_date: First date of the planning
+    :param num_days: Number of days of the planning
+    :param capacities: Capacities allowed in the roster, 1 for full-time employees
+    :param max_employees: Largest number of employees tried
+    :param workers: Number of worker processes, the number of CPUs by default
+    :param beam_width: Solve with a BeamSolver keeping beam_width partial plannings
+    :return: Dictionary with the employees of the roster (None when no roster was found) and the evaluated rosters
+    """
+    rules = compile_rules(employee_restrictions, rules_spec)
+    workers = workers or os.cpu_count() or 1
+    rosters = candidate_rosters(rules, num_days, capacities, max_employees)
+    evaluated = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while batch := list(islice(rosters, workers)):
+            futures = [
+                executor.submit(
+                    first_under_staffed_day, employee_restrictions, rules_spec, start_date, num_days, roster, beam_width
+                )
+                for roster in batch
+            ]
+            for roster, future in zip(batch, futures):
+                under_staffed = future.result()
+                evaluated.append({"capacities": list(roster), "first_under_staffed_day": under_staffed})
+                if under_staffed is None:
+                    for pending in futures:
+                        pending.cancel()
+                    return {"employees": create_roster(roster, employee_restrictions), "evaluated": evaluated}
+
+    return {"employees": None, "evaluated": evaluated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the smallest roster without under-staffed days.")
+    parser.add_argument("case", help="Case folder inside data/<year>")
+    parser.add_argument("--year", type=int, default=2025)
+    parser.add_argument("--capacities", type=float, nargs="+", default=[1.0], help="Capacities allowed in the roster")
+    parser.add_argument("--max-employees", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, the number of CPUs by default")
+    parser.add_argument("--beam-width", type=int, default=None)
+    parser.add_argument("--output", help="Write the roster to this employees.yaml file")
+    args = parser.parse_args()
+
+    script_dir = os.path.abspath("../../")
+    config_file = os.path.join(script_dir, "data", str(args.year), args.case, "config.json")
+    config = load_config(config_file)
+
+    result = size_roster(
+        config["employee_restrictions"],
+        config.get("rules"),
+        start_date=config.get("start_date", f"{args.year}-01-01"),
+        num_days=config.get("num_days", 365),
+        capacities=[int(capacity) if capacity.is_integer() else capacity for capacity in args.capacities],
+        max_employees=args.max_employees,
+        workers=args.workers,
+        beam_width=args.beam_width if args.beam_width is not None else config.get("solver", {}).get("beam_width"),
+    )
+
+    for roster in result["evaluated"]:
+        status = roster["first_under_staffed_day"] or "no under-staffed day"
+        print(f"{len(roster['capacities'])} employees, capacities {roster['capacities']}: {status}")
+
+    employees = result["employees"]
+    if employees is None:
+        print(f"No roster of up to {args.max_employees} employees without under-staffed days")
+        return
+
+    capacities = [employee["capacity"] for employee in employees.values()]
+    print(f"Smallest roster: {len(capacities)} employees, {sum(capacities):g} full-time equivalents")
+    if args.output:
+        roster = {name: {"capacity": employee["capacity"], "name": name} for name, employee in employees.items()}
+        with open(args.output, "w") as file:
+            yaml.safe_dump(roster, file, sort_keys=False)
+
+
+if __name__ == "__main__":
+    main()
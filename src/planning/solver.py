@@ -0,0 +1,672 @@
+"""Solver module.
+
+Greedy day-by-day shift solver working on an integer-coded planning, followed
+by a coverage repair stage over the whole horizon. Every rule check is a lookup
+in the tables of a CompiledRules instance.
+"""
+
+import heapq
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .decision_trace import (
+        ASSIGNED,
+        COVERAGE_HANDOVER,
+        COVERAGE_REPAIR,
+        OCCUPIED,
+        REST_SUCCESSION,
+        SHIFT_FULL,
+        WEEK_HOURS,
+        WEEKEND_REST,
+        YEAR_HOURS,
+    )
+    from .rules import EMPTY, FIRST_SHIFT, REST
+except ImportError:
+    from decision_trace import (
+        ASSIGNED,
+        COVERAGE_HANDOVER,
+        COVERAGE_REPAIR,
+        OCCUPIED,
+        REST_SUCCESSION,
+        SHIFT_FULL,
+        WEEK_HOURS,
+        WEEKEND_REST,
+        YEAR_HOURS,
+    )
+    from rules import EMPTY, FIRST_SHIFT, REST
+
+PlannedDays = namedtuple("PlannedDays", ["first_day", "dates", "codes", "counts"])
+PlannedDays.__doc__ = """Finished days of a planning.
+
+:param first_day: Day offset of the first day
+:param dates: DatetimeIndex with the days
+:param codes: numpy int8 array (days x employees) with the planning codes
+:param counts: numpy array (days x shifts) with the number of employees of each shift
+"""
+
+
+class ShiftSolver:
+    """Greedy day-by-day shift solver.
+
+    :param grid: numpy int8 array (days x employees) with the initial planning codes
+    :param dates: DatetimeIndex with the days of the planning
+    :param max_hours_year: Maximum yearly hours of each employee, in column order
+    :param rules: CompiledRules
+    :param trace: Optional DecisionTrace receiving the outcome of each candidate evaluation
+    :param history: Optional numpy int8 array with the codes of the days right before the planning
+    :param rotation_days: Length of the rotation taken from the end of history, over the first rotation_days days
+        the employees it puts on a shift are tried first among otherwise equal candidates
+    """
+
+    def __init__(self, grid, dates, max_hours_year, rules, trace=None, history=None, rotation_days=None):
+        self.rules = rules
+        self.trace = trace
+        self.num_days, self.num_employees = grid.shape
+        if history is None:
+            history = np.zeros((0, self.num_employees), dtype=grid.dtype)
+        self.offset = len(history)
+        self.full = np.vstack([history, grid])
+        self.grid = self.full[self.offset :]
+        self.dates = dates
+
+        self.weekdays = dates.weekday.to_numpy()
+        periods = dates.year.to_numpy() * 12 + dates.month.to_numpy()
+        self.months = periods - periods[0]
+
+        history_dates = dates[0] - pd.to_timedelta(np.arange(self.offset, 0, -1), unit="D")
+        same_year = history_dates.year == dates[0].year
+
+        self.max_hours_year = np.asarray(max_hours_year, dtype=np.float64)
+        self.year_hours = rules.hours[self.grid].sum(axis=0) + rules.hours[history[same_year]].sum(axis=0)
+        self.counts = (self.grid[:, :, None] == rules.shift_codes).sum(axis=1)
+        self.window_sums = np.zeros((self.num_days, self.num_employees))
+        self.rest_weekends = np.zeros((self.months[-1] + 1, self.num_employees), dtype=np.int64)
+        self.rest_in_weekend = np.zeros(rules.num_shifts, dtype=bool)
+        if rules.weekend_tail[self.weekdays[0]]:
+            days_since_start = (self.weekdays[0] - rules.weekend_start_day) % 7
+            self.rest_in_weekend[:] = self.offset >= days_since_start
+
+        self.rotation = None
+        if rotation_days:
+            if rotation_days > self.offset:
+                raise ValueError(f"Rotation of {rotation_days} days needs as many days of history")
+            self.rotation = history[self.offset - rotation_days :][: self.num_days]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["grid"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.grid = self.full[self.offset :]
+
+    def set_cell(self, day, employee, code):
+        """Set a planning cell keeping the counters up to date.
+
+        :param day: Day offset
+        :param employee: Employee index
+        :param code: New cell code
+        """
+        previous = self.grid[day, employee]
+        if previous >= FIRST_SHIFT and previous - FIRST_SHIFT < self.rules.num_shifts:
+            self.counts[day, previous - FIRST_SHIFT] -= 1
+        if code >= FIRST_SHIFT and code - FIRST_SHIFT < self.rules.num_shifts:
+            self.counts[day, code - FIRST_SHIFT] += 1
+        self.year_hours[employee] += self.rules.hours[code] - self.rules.hours[previous]
+        self.grid[day, employee] = code
+
+    def window_hours(self, day):
+        """Hours worked by each employee in the rolling window ending the day before.
+
+        :param day: Day offset
+        :return: numpy float array indexed by employee
+        """
+        row = self.offset + day
+        start = max(0, row - self.rules.window_days + 1)
+        return self.rules.hours[self.full[start:row]].sum(axis=0)
+
+    def candidates(self, day, shift):
+        """Employees that can take a shift, in assignment order.
+
+        :param day: Day offset
+        :param shift: Shift index
+        :return: numpy array of employee indexes
+        """
+        rules = self.rules
+        row = self.grid[day]
+        free = row == EMPTY
+        if self.offset + day > 0:
+            previous_row = self.full[self.offset + day - 1]
+            succession = rules.forbidden[previous_row, shift]
+            previous_is_shift = previous_row == FIRST_SHIFT + shift
+        else:
+            succession = np.zeros(self.num_employees, dtype=bool)
+            previous_is_shift = succession
+        shift_hours = rules.hours[FIRST_SHIFT + shift]
+        year_limit = self.year_hours + shift_hours > self.max_hours_year
+        week_limit = self.window_hours(day) + shift_hours > rules.max_hours_week
+        available = free & ~succession & ~year_limit & ~week_limit
+
+        if self.trace is not None:
+            for employee in range(self.num_employees):
+                if not free[employee]:
+                    reason = OCCUPIED
+                elif succession[employee]:
+                    reason = REST_SUCCESSION
+                elif year_limit[employee]:
+                    reason = YEAR_HOURS
+                elif week_limit[employee]:
+                    reason = WEEK_HOURS
+                else:
+                    continue
+                self.trace.record(day, employee, shift, reason)
+
+        employees = np.flatnonzero(available)
+        keys = [self.rest_weekends[self.months[day], employees], ~previous_is_shift[employees]]
+        if self.rotation is not None and day < len(self.rotation):
+            keys.insert(0, self.rotation[day, employees] != FIRST_SHIFT + shift)
+        return employees[np.lexsort(keys)]
+
+    def assign(self, day, shift, candidates):
+        """Assign candidates to a shift, giving weekend rest when possible.
+
+        :param day: Day offset
+        :param shift: Shift index
+        :param candidates: Employee indexes in assignment order
+        """
+        rules = self.rules
+        weekday = self.weekdays[day]
+        code = FIRST_SHIFT + shift
+        remaining = len(candidates)
+        for position, employee in enumerate(candidates):
+            if remaining > 1 and rules.weekend[weekday] and not self.rest_in_weekend[shift]:
+                remaining -= 1
+                if weekday == rules.weekend_start_day:
+                    for offset in rules.weekend_rest_offsets:
+                        if day + offset < self.num_days:
+                            self.set_cell(day + offset, employee, REST)
+                    self.rest_weekends[self.months[day], employee] += 1
+                    self.rest_in_weekend[shift] = True
+                if self.trace is not None:
+                    self.trace.record(day, employee, shift, WEEKEND_REST)
+                continue
+            self.set_cell(day, employee, code)
+            if self.trace is not None:
+                self.trace.record(day, employee, shift, ASSIGNED)
+
+            if self.counts[day, shift] >= rules.max_persons[shift]:
+                if self.trace is not None:
+                    for not_needed in candidates[position + 1 :]:
+                        self.trace.record(day, not_needed, shift, SHIFT_FULL)
+                break  # No more employees needed
+
+    def feasible(self, day, shift, week=True):
+        """Employees that can take a shift on an already planned day.
+
+        Unlike candidates, the successor day and every rolling window containing
+        the day are checked, so the cell can be filled after the whole horizon
+        has been planned. Needs the window sums built by repair.
+
+        :param day: Day offset
+        :param shift: Shift index
+        :param week: Check the weekly hours
+        :return: numpy bool array indexed by employee
+        """
+        rules = self.rules
+        code = FIRST_SHIFT + shift
+        shift_hours = rules.hours[code]
+        row = self.offset + day
+        available = self.full[row] == EMPTY
+        if row > 0:
+            available &= ~rules.forbidden[self.full[row - 1], shift]
+        if day + 1 < self.num_days:
+            forbidden_next = np.zeros(len(rules.hours), dtype=bool)
+            forbidden_next[rules.shift_codes] = rules.forbidden[code]
+            available &= ~forbidden_next[self.grid[day + 1]]
+        available &= self.year_hours + shift_hours <= self.max_hours_year
+        if week:
+            last = min(day + rules.window_days, self.num_days)
+            available &= self.window_sums[day:last].max(axis=0) + shift_hours <= rules.max_hours_week
+        return available
+
+    def _most_slack(self, available):
+        return int(np.argmax(np.where(available, self.max_hours_year - self.year_hours, -np.inf)))
+
+    def _fill(self, day, employee, code):
+        previous = self.grid[day, employee]
+        self.set_cell(day, employee, code)
+        hours = self.rules.hours
+        self.window_sums[day : day + self.rules.window_days, employee] += hours[code] - hours[previous]
+        if self.trace is not None:
+            if code != EMPTY:
+                self.trace.record(day, employee, code - FIRST_SHIFT, COVERAGE_REPAIR)
+            elif self.rules.worked[previous]:
+                self.trace.record(day, employee, previous - FIRST_SHIFT, COVERAGE_HANDOVER)
+
+    def _relieve(self, day, shift):
+        """Fill a gap with an employee blocked by the weekly hours, handing one of
+        their shifts of the same windows to an employee free on that day.
+
+        :return: Day of the handed shift, None when no move was found
+        """
+        rules = self.rules
+        window = rules.window_days
+        shift_hours = rules.hours[FIRST_SHIFT + shift]
+        ends = np.arange(day, min(day + window, self.num_days))
+        blocked = self.feasible(day, shift, week=False)
+        for employee in np.argsort(self.year_hours - self.max_hours_year, kind="stable"):
+            if not blocked[employee]:
+                continue
+            sums = self.window_sums[ends, employee]
+            for other_day in range(max(0, day - window + 1), ends[-1] + 1):
+                other_code = self.grid[other_day, employee]
+                if not rules.worked[other_code] or other_day == day:
+                    continue
+                shared = (ends >= other_day) & (ends - window < other_day)
+                if (sums - shared * rules.hours[other_code]).max() + shift_hours > rules.max_hours_week:
+                    continue
+                takers = self.feasible(other_day, other_code - FIRST_SHIFT)
+                if not takers.any():
+                    continue
+                self._fill(other_day, employee, EMPTY)
+                self._fill(other_day, self._most_slack(takers), other_code)
+                self._fill(day, employee, FIRST_SHIFT + shift)
+                return other_day
+        return None
+
+    def _update_window_sums(self, first, last):
+        """Recompute the hours of the rolling windows ending on the days first to last - 1."""
+        window = self.rules.window_days
+        first, last = max(0, first), min(self.num_days, last)
+        low = max(0, self.offset + first - window + 1)
+        hours = self.rules.hours[self.full[low : self.offset + last]]
+        cumulative = np.vstack([np.zeros((1, self.num_employees)), np.cumsum(hours, axis=0)])
+        rows = np.arange(self.offset + first, self.offset + last) + 1 - low
+        self.window_sums[first:last] = cumulative[rows] - cumulative[np.maximum(rows - window, 0)]
+
+    def repair(self, first=0, last=None):
+        """Fill the under-staffed shifts left by the day-by-day pass.
+
+        Gaps are indexed once and filled in order of how many employees can take
+        them, each time with the employee that has the most yearly hours left.
+        A gap without candidates is filled by an employee blocked only by the
+        weekly hours when one of their shifts of the same windows can be handed
+        to an employee free on that day. Every rule is respected, so gaps
+        without such a move stay under-staffed.
+
+        Fills only change the days less than window_days away from their gap.
+
+        :param first: Day offset of the first gap to repair
+        :param last: Day offset after the last gap to repair, the end of the planning by default
+        :return: Number of gaps filled
+        """
+        rules = self.rules
+        window = rules.window_days
+        last = self.num_days if last is None else last
+        self._update_window_sums(first - window + 1, last + 2 * window - 2)
+        max_shift_hours = rules.hours[rules.shift_codes].max()
+
+        heap, candidates_count = [], {}
+
+        def push(day, shift):
+            if self.counts[day, shift] < rules.min_persons[shift]:
+                count = int(self.feasible(day, shift).sum())
+                candidates_count[(day, shift)] = count
+                heapq.heappush(heap, (count, day, shift))
+            else:
+                candidates_count.pop((day, shift), None)
+
+        for day, shift in zip(*np.nonzero(self.counts[first:last] < rules.min_persons)):
+            push(first + int(day), int(shift))
+
+        filled = 0
+        while heap:
+            count, day, shift = heapq.heappop(heap)
+            if candidates_count.get((day, shift)) != count:
+                continue  # Outdated entry
+
+            capped = self.year_hours + max_shift_hours > self.max_hours_year
+            if count:
+                self._fill(day, self._most_slack(self.feasible(day, shift)), FIRST_SHIFT + shift)
+                reach = window
+            elif self._relieve(day, shift) is not None:
+                reach = 2 * window
+            else:
+                del candidates_count[(day, shift)]  # No move left for this gap
+                continue
+            filled += 1
+
+            if (self.year_hours + max_shift_hours > self.max_hours_year).sum() > capped.sum():
+                affected = list(candidates_count)
+            else:
+                affected = [gap for gap in candidates_count if abs(gap[0] - day) < reach]
+            for gap in affected:
+                push(*gap)
+
+        return filled
+
+    def solve_day(self, day):
+        """Fill one day of the planning, leaving empty the cells without a shift.
+
+        :param day: Day offset
+        """
+        rules = self.rules
+        for shift in range(rules.num_shifts):
+            if self.counts[day, shift] >= rules.max_persons[shift]:  # No more employees needed
+                continue
+            if self.weekdays[day] == rules.weekend_start_day:
+                self.rest_in_weekend[shift] = False
+
+            self.assign(day, shift, self.candidates(day, shift))
+
+    def finish(self):
+        """Repair the coverage and give rest on the cells left empty."""
+        self.repair()
+        self.grid[self.grid == EMPTY] = REST
+
+    def _planned_days(self, first, last):
+        codes = self.grid[first:last]
+        codes[codes == EMPTY] = REST
+        return PlannedDays(first, self.dates[first:last], codes.copy(), self.counts[first:last].copy())
+
+    def stream(self, chunk_days=1):
+        """Fill the planning yielding the days as soon as they are final.
+
+        The coverage of each day is repaired once the days it can borrow from
+        are planned, so a day is final 2 * (window_days - 1) days after the
+        day-by-day pass reached it. The repair works day by day instead of over
+        the whole planning in order of fewest candidates, so when gaps remain
+        the planning can differ from solve, including in the number of
+        under-staffed shifts. Closing the generator stops the planning.
+
+        :param chunk_days: Number of days of each yielded record, 7 for weeks
+        :return: Generator of PlannedDays
+        """
+        window = self.rules.window_days
+        emitted = 0
+        for day in range(self.num_days):
+            self.solve_day(day)
+            gap_day = day - window + 1
+            if gap_day < 0:
+                continue
+            self.repair(gap_day, gap_day + 1)
+            final = gap_day - window + 2  # Days before final cannot change any more
+            while final - emitted >= chunk_days:
+                yield self._planned_days(emitted, emitted + chunk_days)
+                emitted += chunk_days
+
+        self.repair(max(0, self.num_days - window + 1))
+        while emitted < self.num_days:
+            yield self._planned_days(emitted, min(emitted + chunk_days, self.num_days))
+            emitted += chunk_days
+
+    def solve(self):
+        """Fill the whole planning.
+
+        :return: numpy int8 array with the planning codes
+        """
+        for day in range(self.num_days):
+            self.solve_day(day)
+        self.finish()
+        return self.grid
+
+
+class _Branch:
+    """Partial planning kept in the beam.
+
+    Only the planning rows read or written by the next steps (the rolling window
+    and the days that can receive a weekend rest) are stored, the finished rows
+    are shared with the other branches through the path linked list.
+    """
+
+    __slots__ = ("path", "rows", "counts", "year_hours", "rest_weekends", "rest_in_weekend", "key")
+
+    def __init__(self, path, rows, counts, year_hours, rest_weekends, rest_in_weekend, key):
+        self.path = path
+        self.rows = rows
+        self.counts = counts
+        self.year_hours = year_hours
+        self.rest_weekends = rest_weekends
+        self.rest_in_weekend = rest_in_weekend
+        self.key = key
+
+    def state(self):
+        """Bytes identifying the branch state, branches with the same state have the same future."""
+        return b"".join(
+            array.tobytes()
+            for array in (self.rows, self.counts, self.year_hours, self.rest_weekends, self.rest_in_weekend)
+        )
+
+
+class BeamSolver(ShiftSolver):
+    """Beam search over the choices of the greedy solver.
+
+    For every shift of every day each branch of the beam is expanded with the
+    greedy candidate order and with the orders putting one of the next
+    candidates first, which changes who gets the weekend rest and who works.
+    The best beam_width branches are kept, ranked by under-staffed shifts,
+    staffing shortfall of the next days and number of choices different from the
+    greedy one. The best branch then goes through the coverage repair stage. A
+    beam width of 1 gives the greedy planning.
+
+    With workers, the branches of each step are expanded in worker processes
+    holding a copy of the solver. Each worker receives the compact state of its
+    branches, without their finished rows, and sends back its best children.
+    The planning is the same as with a single process.
+
+    :param grid: numpy int8 array (days x employees) with the initial planning codes
+    :param dates: DatetimeIndex with the days of the planning
+    :param max_hours_year: Maximum yearly hours of each employee, in column order
+    :param rules: CompiledRules
+    :param beam_width: Number of partial plannings kept after each step
+    :param history: Optional numpy int8 array with the codes of the days right before the planning
+    :param rotation_days: Length of the rotation taken from the end of history, over the first rotation_days days
+        the employees it puts on a shift are tried first among otherwise equal candidates
+    :param workers: Number of worker processes expanding the beam, the branches are expanded in the calling
+        process when not given
+    """
+
+    def __init__(
+        self, grid, dates, max_hours_year, rules, beam_width=8, history=None, rotation_days=None, workers=None
+    ):
+        super().__init__(grid, dates, max_hours_year, rules, history=history, rotation_days=rotation_days)
+        if beam_width < 1:
+            raise ValueError(f"Beam width must be at least 1, got {beam_width}")
+        if workers is not None and workers < 1:
+            raise ValueError(f"Number of workers must be at least 1, got {workers}")
+        self.beam_width = beam_width
+        self.workers = workers
+        self.span = max(rules.weekend_rest_offsets, default=0)
+        self.lookahead = max(self.span, 1)
+        self.min_shift_hours = rules.hours[rules.shift_codes].min() if rules.num_shifts else 0.0
+
+    def _bounds(self, day):
+        row = self.offset + day
+        return max(0, row - self.rules.window_days + 1), min(len(self.full), row + self.span + 1)
+
+    def _load(self, branch, day):
+        low, high = self._bounds(day)
+        self.full[low:high] = branch.rows
+        self.counts[day : day + len(branch.counts)] = branch.counts
+        self.year_hours[:] = branch.year_hours
+        self.rest_weekends[self.months[day]] = branch.rest_weekends
+        self.rest_in_weekend[:] = branch.rest_in_weekend
+
+    def _shortfall(self, day):
+        """Staffing shortfall and slack of the days after day, given the working state."""
+        rules = self.rules
+        year_ok = self.year_hours + self.min_shift_hours <= self.max_hours_year
+        shortfall = slack = 0
+        for next_day in range(day + 1, min(day + 1 + self.lookahead, self.num_days)):
+            available = (self.grid[next_day] == EMPTY) & year_ok
+            if next_day == day + 1:
+                available &= self.window_hours(next_day) + self.min_shift_hours <= rules.max_hours_week
+            needed = np.maximum(rules.min_persons - self.counts[next_day], 0).sum()
+            margin = int(available.sum()) - int(needed)
+            shortfall += max(0, -margin)
+            slack += margin
+        return shortfall, slack
+
+    def _save(self, branch, day, day_end, deficit, changes):
+        shortfall, slack = self._shortfall(day)
+        path = branch.path
+        if day_end:
+            path = (path, self.grid[day].copy())
+            day += 1
+        low, high = self._bounds(day)
+        if day < self.num_days:
+            rest_weekends = self.rest_weekends[self.months[day]].copy()
+            if day_end and self.months[day] != self.months[day - 1]:
+                rest_weekends[:] = 0
+        else:
+            rest_weekends = np.zeros(0, dtype=self.rest_weekends.dtype)
+        return _Branch(
+            path,
+            self.full[low:high].copy(),
+            self.counts[day : day + self.span + 1].copy(),
+            self.year_hours.copy(),
+            rest_weekends,
+            self.rest_in_weekend.copy(),
+            (deficit, shortfall, -slack, changes),
+        )
+
+    def _expand(self, branch, day, shift):
+        """Children of a branch for one shift of one day."""
+        rules = self.rules
+        deficit, _, _, changes = branch.key
+        day_end = shift == rules.num_shifts - 1
+        self._load(branch, day)
+        if self.counts[day, shift] >= rules.max_persons[shift]:  # No more employees needed
+            return [self._save(branch, day, day_end, deficit, changes)]
+
+        candidates = self.candidates(day, shift)
+        children = []
+        for choice in range(min(self.beam_width, max(len(candidates), 1))):
+            if choice:
+                self._load(branch, day)
+                order = np.concatenate([candidates[choice : choice + 1], np.delete(candidates, choice)])
+            else:
+                order = candidates
+            if self.weekdays[day] == rules.weekend_start_day:
+                self.rest_in_weekend[shift] = False
+
+            self.assign(day, shift, order)
+            missing = max(0, rules.min_persons[shift] - self.counts[day, shift])
+            children.append(self._save(branch, day, day_end, deficit + missing, changes + (choice > 0)))
+        return children
+
+    def _prune(self, children):
+        children.sort(key=lambda child: child.key)
+        beam, states = [], set()
+        for child in children:
+            state = child.state()
+            if state not in states:
+                states.add(state)
+                beam.append(child)
+                if len(beam) == self.beam_width:
+                    break
+        return beam
+
+    def _expand_in_workers(self, executor, beam, day, shift):
+        """Expand the beam in the worker processes, one group of consecutive branches per worker.
+
+        The groups keep the order of the beam, so ties between children are broken as in a single process.
+        """
+        size = -(-len(beam) // self.workers)
+        groups = [beam[first : first + size] for first in range(0, len(beam), size)]
+        futures = []
+        for group in groups:
+            # The path of a branch is replaced by its position, the workers do not need the finished rows
+            branches = [
+                _Branch(
+                    position,
+                    branch.rows,
+                    branch.counts,
+                    branch.year_hours,
+                    branch.rest_weekends,
+                    branch.rest_in_weekend,
+                    branch.key,
+                )
+                for position, branch in enumerate(group)
+            ]
+            futures.append(executor.submit(_expand_branches, branches, day, shift))
+
+        children = []
+        for group, future in zip(groups, futures):
+            for child in future.result():
+                if isinstance(child.path, tuple):
+                    position, row = child.path
+                    child.path = (group[position].path, row)
+                else:
+                    child.path = group[child.path].path
+                children.append(child)
+        return self._prune(children)
+
+    def solve(self):
+        """Fill the whole planning keeping the best branch.
+
+        :return: numpy int8 array with the planning codes
+        """
+        low, high = self._bounds(0)
+        branch = _Branch(
+            None,
+            self.full[low:high].copy(),
+            self.counts[: self.span + 1].copy(),
+            self.year_hours.copy(),
+            self.rest_weekends[0].copy(),
+            self.rest_in_weekend.copy(),
+            (0, 0, 0, 0),
+        )
+        beam = [branch]
+        if self.workers is None:
+            for day in range(self.num_days):
+                for shift in range(self.rules.num_shifts):
+                    beam = self._prune([child for branch in beam for child in self._expand(branch, day, shift)])
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self,)) as executor:
+                for day in range(self.num_days):
+                    for shift in range(self.rules.num_shifts):
+                        beam = self._expand_in_workers(executor, beam, day, shift)
+
+        best = beam[0]
+        path = best.path
+        for day in range(self.num_days - 1, -1, -1):
+            path, row = path
+            self.grid[day] = row
+        self.counts = (self.grid[:, :, None] == self.rules.shift_codes).sum(axis=1)
+        self.year_hours[:] = best.year_hours
+        self.best_key = best.key
+        self.finish()
+        return self.grid
+
+    def stream(self, chunk_days=1):
+        """Fill the planning and yield it in records of chunk_days days.
+
+        The best branch is only known at the end of the search, so the days are
+        yielded after the whole planning has been solved.
+
+        :param chunk_days: Number of days of each yielded record, 7 for weeks
+        :return: Generator of PlannedDays
+        """
+        self.solve()
+        for first in range(0, self.num_days, chunk_days):
+            yield self._planned_days(first, min(first + chunk_days, self.num_days))
+
+
+_worker_solver = None
+
+
+def _init_worker(solver):
+    global _worker_solver
+    _worker_solver = solver
+
+
+def _expand_branches(branches, day, shift):
+    """Expand branches in a worker process, keeping the children that can reach the beam."""
+    children = [child for branch in branches for child in _worker_solver._expand(branch, day, shift)]
+    return _worker_solver._prune(children)
@@ -0,0 +1,313 @@
+"""Swaps module.
+
+Answers shift change and swap questions on a solved planning ("who can take
+E3's T shift on 2025-03-14", "can E1 and E4 swap these two days") from
+per-employee indexes kept up to date when a change is accepted: rolling window
+hours, yearly hours, worked days of each weekend, rest weekends of each month
+and shift headcounts.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .rules import EMPTY, FIRST_SHIFT, REST
+except ImportError:
+    from rules import EMPTY, FIRST_SHIFT, REST
+
+
+class ShiftSwaps:
+    """Shift changes and swaps on a solved planning.
+
+    A change is feasible when it does not break a rule that the planning
+    respected: rest successions, weekly and yearly hours, monthly weekend rest
+    and minimum and maximum persons per shift.
+
+    :param employees_info: DataFrame with a row per date and a column per employee
+    :param employees: List of employees
+    :param rules: CompiledRules
+    """
+
+    def __init__(self, employees_info, employees, rules):
+        self.rules = rules
+        self.dates = pd.DatetimeIndex(pd.to_datetime(employees_info.index))
+        self.start_date = self.dates[0]
+        self.employees = list(employees_info.columns)
+        self.employee_index = {employee: index for index, employee in enumerate(self.employees)}
+        self.codes = rules.encode(employees_info)
+        self.num_days, self.num_employees = self.codes.shape
+        self.max_hours_year = np.array(
+            [rules.max_hours_year * employees[employee]["capacity"] for employee in self.employees]
+        )
+
+        self.free = np.zeros(len(rules.hours), dtype=bool)
+        self.free[[EMPTY, REST]] = True
+        self.forbidden_pairs = np.zeros((len(rules.hours), len(rules.hours)), dtype=bool)
+        self.forbidden_pairs[:, rules.shift_codes] = rules.forbidden
+
+        hours = rules.hours[self.codes]
+        self.year_hours = hours.sum(axis=0)
+        window = rules.window_days
+        cumulative = np.vstack([np.zeros((1, self.num_employees)), np.cumsum(hours, axis=0)])
+        rows = np.arange(1, self.num_days + 1)
+        self.window_sums = cumulative[rows] - cumulative[np.maximum(rows - window, 0)]
+        self.counts = (self.codes[:, :, None] == rules.shift_codes).sum(axis=1)
+
+        weekdays = self.dates.weekday.to_numpy()
+        periods = self.dates.year.to_numpy() * 12 + self.dates.month.to_numpy()
+        months = periods - periods[0]
+        self.weekend_block = np.full(self.num_days, -1)
+        block_months = []
+        for day in range(self.num_days):
+            if not rules.weekend[weekdays[day]]:
+                continue
+            if day == 0 or self.weekend_block[day - 1] < 0 or weekdays[day] == rules.weekend_start_day:
+                block_months.append(months[day])
+            self.weekend_block[day] = len(block_months) - 1
+        self.block_month = np.array(block_months, dtype=np.int64)
+
+        weekend_days = np.flatnonzero(self.weekend_block >= 0)
+        self.weekend_work = np.zeros((len(block_months), self.num_employees), dtype=np.int64)
+        np.add.at(self.weekend_work, self.weekend_block[weekend_days], rules.worked[self.codes[weekend_days]])
+        self.rest_weekends = np.zeros((months[-1] + 1, self.num_employees), dtype=np.int64)
+        np.add.at(self.rest_weekends, self.block_month, self.weekend_work == 0)
+
+    def _day(self, date):
+        day = (pd.Timestamp(date) - self.start_date).days
+        if not 0 <= day < self.num_days:
+            raise ValueError(f"{date} is not in the planning")
+        return day
+
+    def _shift_code(self, day, employee):
+        code = self.codes[day, employee]
+        if not self.rules.worked[code]:
+            raise ValueError(f"{self.employees[employee]} has no shift on {self.dates[day].date()}")
+        return code
+
+    def takers(self, day, shift):
+        """Employees that can take one more shift.
+
+        :param day: Day offset
+        :param shift: Shift index
+        :return: numpy bool array indexed by employee
+        """
+        rules = self.rules
+        code = FIRST_SHIFT + shift
+        shift_hours = rules.hours[code]
+        available = self.free[self.codes[day]]
+        if day > 0:
+            available &= ~self.forbidden_pairs[self.codes[day - 1], code]
+        if day + 1 < self.num_days:
+            available &= ~self.forbidden_pairs[code, self.codes[day + 1]]
+        available &= self.year_hours + shift_hours <= self.max_hours_year
+        last = min(day + rules.window_days, self.num_days)
+        available &= self.window_sums[day:last].max(axis=0) + shift_hours <= rules.max_hours_week
+
+        block = self.weekend_block[day]
+        if block >= 0:
+            resting = self.weekend_work[block] == 0
+            available &= ~resting | (self.rest_weekends[self.block_month[block]] > rules.min_weekend_rest)
+        return available
+
+    def who_can_take(self, employee, date):
+        """Employees that can take the shift of an employee.
+
+        :param employee: Employee name
+        :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+        :return: List of employee names, the ones with more yearly hours left first
+        """
+        day = self._day(date)
+        giver = self.employee_index[employee]
+        code = self._shift_code(day, giver)
+        available = self.takers(day, code - FIRST_SHIFT)
+        available[giver] = False
+        takers = np.flatnonzero(available)
+        takers = takers[np.argsort(self.year_hours[takers] - self.max_hours_year[takers], kind="stable")]
+        return [self.employees[taker] for taker in takers]
+
+    def _give_changes(self, employee, date, taker):
+        day = self._day(date)
+        giver, receiver = self.employee_index[employee], self.employee_index[taker]
+        if giver == receiver:
+            raise ValueError("A shift must be given to another employee")
+        return [(day, giver, REST), (day, receiver, self._shift_code(day, giver))]
+
+    def _swap_changes(self, employee_a, date_a, employee_b, date_b):
+        day_a, day_b = self._day(date_a), self._day(date_b)
+        a, b = self.employee_index[employee_a], self.employee_index[employee_b]
+        if a == b:
+            raise ValueError("A swap needs two different employees")
+        code_a, code_b = self._shift_code(day_a, a), self._shift_code(day_b, b)
+        if day_a == day_b:
+            return [(day_a, a, code_b), (day_a, b, code_a)]
+        return [(day_a, a, REST), (day_a, b, code_a), (day_b, b, REST), (day_b, a, code_b)]
+
+    def check(self, changes):
+        """Rules broken by a set of cell changes that the planning respected.
+
+        A shift can only be put on a free cell, or on a worked cell whose shift goes to another employee
+        of the same day, like in a swap on the same date. Otherwise the cell is reported as occupied.
+
+        :param changes: List of (day offset, employee index, new code)
+        :return: List of (date, employee, rule) tuples, empty when the changes are feasible
+        """
+        rules = self.rules
+        window = rules.window_days
+        violations = []
+        cells_by_employee = {}
+        for day, employee, code in changes:
+            cells_by_employee.setdefault(employee, {})[day] = code
+        taken = {}
+        for employee, cells in cells_by_employee.items():
+            for day, code in cells.items():
+                if rules.worked[code]:
+                    taken.setdefault((day, code), set()).add(employee)
+
+        count_changes = {}
+        for employee, cells in cells_by_employee.items():
+            name = self.employees[employee]
+            column = self.codes[:, employee]
+
+            def new_code(day):
+                return cells.get(day, column[day])
+
+            days = sorted(cells)
+            for day in days:
+                if rules.worked[cells[day]] and not self.free[column[day]]:
+                    if not rules.worked[column[day]] or not taken.get((day, column[day]), set()) - {employee}:
+                        violations.append((self.dates[day], name, "occupied"))
+                for previous_day in (day - 1, day):
+                    if previous_day < 0 or previous_day + 1 >= self.num_days:
+                        continue
+                    before = self.forbidden_pairs[column[previous_day], column[previous_day + 1]]
+                    if not before and self.forbidden_pairs[new_code(previous_day), new_code(previous_day + 1)]:
+                        violations.append((self.dates[previous_day + 1], name, "rest_succession"))
+
+            deltas = np.zeros(days[-1] - days[0] + window)
+            for day in days:
+                deltas[day - days[0]] = rules.hours[cells[day]] - rules.hours[column[day]]
+                for code, step in ((column[day], -1), (cells[day], 1)):
+                    if rules.worked[code]:
+                        key = (day, code - FIRST_SHIFT)
+                        count_changes[key] = count_changes.get(key, 0) + step
+
+            if deltas.sum() > 0 and self.year_hours[employee] + deltas.sum() > self.max_hours_year[employee]:
+                violations.append((self.dates[days[-1]], name, "year_hours"))
+
+            cumulative = np.concatenate([[0.0], np.cumsum(deltas)])
+            ends = np.arange(len(deltas)) + 1
+            window_deltas = cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+            last = min(days[0] + len(deltas), self.num_days)
+            window_deltas = window_deltas[: last - days[0]]
+            window_sums = self.window_sums[days[0] : last, employee]
+            worse = (window_deltas > 0) & (window_sums + window_deltas > rules.max_hours_week)
+            for offset in np.flatnonzero(worse)[:1]:
+                violations.append((self.dates[days[0] + offset], name, "week_hours"))
+
+            rest_changes = {}
+            weekend_days = [day for day in days if self.weekend_block[day] >= 0]
+            for block in {self.weekend_block[day] for day in weekend_days}:
+                worked = self.weekend_work[block, employee] + sum(
+                    int(rules.worked[cells[day]]) - int(rules.worked[column[day]])
+                    for day in weekend_days
+                    if self.weekend_block[day] == block
+                )
+                month = self.block_month[block]
+                change = int(worked == 0) - int(self.weekend_work[block, employee] == 0)
+                rest_changes[month] = rest_changes.get(month, 0) + change
+            for month, change in rest_changes.items():
+                if change < 0 and self.rest_weekends[month, employee] + change < rules.min_weekend_rest:
+                    first_day = next(day for day in weekend_days if self.block_month[self.weekend_block[day]] == month)
+                    violations.append((self.dates[first_day], name, "weekend_rest"))
+
+        for (day, shift), change in count_changes.items():
+            count = self.counts[day, shift] + change
+            if change < 0 and count < rules.min_persons[shift]:
+                violations.append((self.dates[day], None, "under_coverage"))
+            elif change > 0 and count > rules.max_persons[shift]:
+                violations.append((self.dates[day], None, "over_coverage"))
+
+        return violations
+
+    def can_take(self, employee, date, taker):
+        """Check that an employee can take the shift of another one.
+
+        :param employee: Employee giving the shift
+        :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+        :param taker: Employee taking the shift
+        :return: True when no rule is broken
+        """
+        return not self.check(self._give_changes(employee, date, taker))
+
+    def can_swap(self, employee_a, date_a, employee_b, date_b):
+        """Check that two employees can swap their shifts.
+
+        employee_a works the shift of employee_b on date_b and employee_b the shift of employee_a on date_a.
+        On the same date the two employees exchange their shifts.
+
+        :param employee_a: First employee
+        :param date_a: Date of the shift of employee_a
+        :param employee_b: Second employee
+        :param date_b: Date of the shift of employee_b
+        :return: True when no rule is broken
+        """
+        return not self.check(self._swap_changes(employee_a, date_a, employee_b, date_b))
+
+    def apply(self, changes):
+        """Apply cell changes, updating the indexes of the days and employees involved.
+
+        :param changes: List of (day offset, employee index, new code)
+        """
+        rules = self.rules
+        for day, employee, code in changes:
+            previous = self.codes[day, employee]
+            self.codes[day, employee] = code
+            hours = rules.hours[code] - rules.hours[previous]
+            self.year_hours[employee] += hours
+            self.window_sums[day : day + rules.window_days, employee] += hours
+            if rules.worked[previous]:
+                self.counts[day, previous - FIRST_SHIFT] -= 1
+            if rules.worked[code]:
+                self.counts[day, code - FIRST_SHIFT] += 1
+
+            block = self.weekend_block[day]
+            if block >= 0:
+                rested = self.weekend_work[block, employee] == 0
+                self.weekend_work[block, employee] += int(rules.worked[code]) - int(rules.worked[previous])
+                rests = self.weekend_work[block, employee] == 0
+                self.rest_weekends[self.block_month[block], employee] += int(rests) - int(rested)
+
+    def _accept(self, changes):
+        violations = self.check(changes)
+        if violations:
+            rules = ", ".join(sorted({rule for _, _, rule in violations}))
+            raise ValueError(f"The change breaks the rules: {rules}")
+        self.apply(changes)
+
+    def give(self, employee, date, taker):
+        """Give the shift of an employee to another one.
+
+        :param employee: Employee giving the shift
+        :param date: Date as a pandas Timestamp or a string in 'YYYY-MM-DD' format
+        :param taker: Employee taking the shift
+        :raises ValueError: When a rule is broken
+        """
+        self._accept(self._give_changes(employee, date, taker))
+
+    def swap(self, employee_a, date_a, employee_b, date_b):
+        """Swap the shifts of two employees, see can_swap.
+
+        :param employee_a: First employee
+        :param date_a: Date of the shift of employee_a
+        :param employee_b: Second employee
+        :param date_b: Date of the shift of employee_b
+        :raises ValueError: When a rule is broken
+        """
+        self._accept(self._swap_changes(employee_a, date_a, employee_b, date_b))
+
+    def to_frame(self):
+        """Planning with the accepted changes.
+
+        :return: DataFrame with a row per date and a column per employee
+        """
+        return pd.DataFrame(self.rules.decode(self.codes), index=self.dates, columns=self.employees)
@@ -0,0 +1,101 @@
+"""Writers module.
+
+Writes a planning incrementally, chunk by chunk, as iter_planning yields the
+finished days, so long plannings reach the disk while they are produced.
+"""
+
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+SHEET_NAME = "Shift Schedule"
+
+
+class PlanningWriter:
+    """Incremental writer of a planning.
+
+    The format is given by the file extension:
+
+    - .csv: a row per date and a column per employee
+    - .xlsx: the "Shift Schedule" sheet written by generate_excel
+    - .npy: int8 codes of rules (days x employees), rules.decode gives back the values
+
+    :param filename: Output file
+    :param employees: Employee names, in column order
+    :param num_days: Number of days of the planning, needed for .npy files
+    :param rules: CompiledRules encoding the .npy files
+    """
+
+    def __init__(self, filename, employees, num_days=None, rules=None):
+        self.filename = filename
+        self.employees = list(employees)
+        self.format = os.path.splitext(filename)[1].lower()
+        self.days = 0
+
+        if self.format == ".csv":
+            self.file = open(filename, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["", *self.employees])
+        elif self.format == ".xlsx":
+            self.workbook = Workbook(write_only=True)
+            self.sheet = self.workbook.create_sheet(SHEET_NAME)
+            self.sheet.append([None, *self.employees])
+        elif self.format == ".npy":
+            if num_days is None or rules is None:
+                raise ValueError("num_days and rules are needed to write a .npy planning")
+            self.rules = rules
+            self.codes = np.lib.format.open_memmap(
+                filename, mode="w+", dtype=np.int8, shape=(num_days, len(self.employees))
+            )
+        else:
+            raise ValueError(f"Unsupported planning format {self.format!r}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, employees_info):
+        """Append days to the planning.
+
+        :param employees_info: DataFrame chunk with a row per date and a column per employee
+        """
+        dates = pd.DatetimeIndex(employees_info.index).strftime("%Y-%m-%d")
+        values = employees_info[self.employees].to_numpy(dtype=object)
+        if self.format == ".csv":
+            self.writer.writerows([date, *row] for date, row in zip(dates, values))
+        elif self.format == ".xlsx":
+            for date, row in zip(dates, values):
+                self.sheet.append([date, *row])
+        else:
+            self.codes[self.days : self.days + len(values)] = self.rules.encode(values)
+        self.days += len(values)
+
+    def close(self):
+        """Finish the file."""
+        if self.format == ".csv":
+            self.file.close()
+        elif self.format == ".xlsx":
+            self.workbook.save(self.filename)
+        else:
+            self.codes.flush()
+
+
+def write_planning(chunks, filename, employees, num_days=None, rules=None):
+    """Write the chunks yielded by iter_planning as they are produced.
+
+    :param chunks: Iterable of (employees_info, all_employees_by_shift) chunks
+    :param filename: Output file, .csv, .xlsx or .npy
+    :param employees: Employee names, in column order
+    :param num_days: Number of days of the planning, needed for .npy files
+    :param rules: CompiledRules encoding the .npy files
+    :return: Number of days written
+    """
+    with PlanningWriter(filename, employees, num_days, rules) as writer:
+        for employees_info, _ in chunks:
+            writer.write(employees_info)
+    return writer.days